@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+import struct
+
+# Synthetic MPEG Layer III streams for benchmarks. Frame math is written
+# out here instead of using decoder.frame, so generator bugs and decoder
+# bugs don't cancel each other out
+
+MPEG_1 = 0b11
+MPEG_2 = 0b10
+MPEG_25 = 0b00
+
+STEREO = 0b00
+JOINT_STEREO = 0b01
+MONO = 0b11
+
+LAYER_3 = 0b01
+
+SAMPLERATES = {
+    MPEG_1: (44100, 48000, 32000),
+    MPEG_2: (22050, 24000, 16000),
+    MPEG_25: (11025, 12000, 8000),
+}
+
+BITRATES = {
+    MPEG_1: (None, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256,
+             320),
+    MPEG_2: (None, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144,
+             160),
+}
+BITRATES[MPEG_25] = BITRATES[MPEG_2]
+
+
+def sideinfo_size(standard, channel_mode):
+    if standard == MPEG_1:
+        return 17 if channel_mode == MONO else 32
+    return 9 if channel_mode == MONO else 17
+
+
+def frame_length(standard, bitrate_index, samplerate_index, padding):
+    bitrate = BITRATES[standard][bitrate_index] * 1000
+    samplerate = SAMPLERATES[standard][samplerate_index]
+    coefficient = 144 if standard == MPEG_1 else 72
+    return coefficient * bitrate // samplerate + padding
+
+
+def samples_per_frame(standard):
+    return 1152 if standard == MPEG_1 else 576
+
+
+def make_header(standard, bitrate_index, samplerate_index=0, padding=0,
+                channel_mode=STEREO):
+    # sync, standard, layer III, no CRC
+    value = (0x7ff << 21) | (standard << 19) | (LAYER_3 << 17) | (1 << 16)
+    value |= bitrate_index << 12 | samplerate_index << 10 | padding << 9
+    value |= channel_mode << 6
+    return struct.pack('>I', value)
+
+
+def make_frame(standard, bitrate_index, samplerate_index=0, padding=0,
+               channel_mode=STEREO, payload=b''):
+    """Frame with zeroed sideinfo (silent granules) and given payload"""
+    length = frame_length(standard, bitrate_index, samplerate_index, padding)
+    body = bytes(sideinfo_size(standard, channel_mode)) + payload
+    frame = make_header(standard, bitrate_index, samplerate_index, padding,
+                        channel_mode) + body
+    return frame[:length].ljust(length, b'\0')
+
+
+def make_xing(standard, bitrate_index, samplerate_index, channel_mode,
+              frames_count, bytes_count, vbr=True):
+    toc = bytes(min(255, i * 256 // 100) for i in range(100))
+    payload = (b'Xing' if vbr else b'Info') + struct.pack(
+        '>LLL', 0xf, frames_count, bytes_count) + toc + struct.pack('>L', 50)
+    return make_frame(standard, bitrate_index, samplerate_index, 0,
+                      channel_mode, payload)
+
+
+def make_stream(standard=MPEG_1, channel_mode=STEREO, frames_count=1000,
+                bitrate_index=9, samplerate_index=0, vbr=False, seed=0):
+    """Returns Layer III stream. VBR streams pick random bitrate per frame
+    and start with Xing frame, CBR streams start with Info frame. Padding
+    follows the usual encoder rule to keep average bitrate exact"""
+    rnd = random.Random(seed)
+    samplerate = SAMPLERATES[standard][samplerate_index]
+    coefficient = 144 if standard == MPEG_1 else 72
+    frames = []
+    remainder = 0
+    for _ in range(frames_count):
+        index = rnd.randint(1, 14) if vbr else bitrate_index
+        bitrate = BITRATES[standard][index] * 1000
+        remainder += coefficient * bitrate % samplerate
+        padding = 0
+        if remainder >= samplerate:
+            remainder -= samplerate
+            padding = 1
+        frames.append(make_frame(standard, index, samplerate_index, padding,
+                                 channel_mode))
+    audio = b''.join(frames)
+    xing_bitrate = 14 if vbr else bitrate_index
+    xing = make_xing(standard, xing_bitrate, samplerate_index, channel_mode,
+                     frames_count, len(audio), vbr)
+    return xing + audio
+
+
+def synchsafe(value):
+    return ((value & 0x0fe00000) << 3 | (value & 0x001fc000) << 2
+            | (value & 0x00003f80) << 1 | (value & 0x0000007f))
+
+
+def make_id3v2_frame(frame_id, data):
+    return frame_id + struct.pack('>IH', len(data), 0) + data
+
+
+def make_text_frame(frame_id, text):
+    return make_id3v2_frame(frame_id, b'\x01' + text.encode('utf-16'))
+
+
+def make_id3v2(apic_size=0, text_frames=None, padding=0, seed=0):
+    """ID3v2.3 tag with text frames and APIC frame of given size"""
+    if text_frames is None:
+        text_frames = {b'TIT2': 'Synthetic title', b'TPE1': 'Benchmark',
+                       b'TALB': 'Corpus', b'TYER': '2019', b'TRCK': '1'}
+    body = b''.join(make_text_frame(frame_id, text)
+                    for frame_id, text in text_frames.items())
+    if apic_size:
+        image = random.Random(seed).randbytes(apic_size)
+        body += make_id3v2_frame(
+            b'APIC', b'\x00image/jpeg\x00\x03cover\x00' + image)
+    body += bytes(padding)
+    return b'ID3' + struct.pack('>HBI', 0x0300, 0, synchsafe(len(body))) \
+        + body
+
+
+def make_id3v1(title='Synthetic', artist='Benchmark', album='Corpus'):
+    def field(text, size):
+        return text.encode('latin-1')[:size].ljust(size, b'\0')
+
+    return b'TAG' + field(title, 30) + field(artist, 30) + field(album, 30) \
+        + b'2019' + field('', 30) + b'\x0c'
+
+
+STANDARD_NAMES = {MPEG_1: 'mpeg1', MPEG_2: 'mpeg2', MPEG_25: 'mpeg25'}
+CHANNEL_NAMES = {STEREO: 'stereo', JOINT_STEREO: 'joint', MONO: 'mono'}
+
+
+def default_corpus(scale=1.0):
+    """Yields (name, bytes). scale=1.0 is about one minute per stream"""
+    for standard in (MPEG_1, MPEG_2, MPEG_25):
+        frames_count = max(1, int(60 * scale * SAMPLERATES[standard][0]
+                                  / samples_per_frame(standard)))
+        for channel_mode in (STEREO, MONO):
+            name = f'{STANDARD_NAMES[standard]}_' \
+                   f'{CHANNEL_NAMES[channel_mode]}'
+            yield f'{name}_cbr.mp3', make_stream(
+                standard, channel_mode, frames_count)
+            yield f'{name}_vbr.mp3', make_stream(
+                standard, channel_mode, frames_count, vbr=True)
+    frames_count = max(1, int(60 * scale * 44100 / 1152))
+    audio = make_stream(MPEG_1, JOINT_STEREO, frames_count)
+    for apic_size in (0, 64 * 1024, 2 * 1024 * 1024):
+        yield f'tagged_apic{apic_size // 1024}k.mp3', \
+            make_id3v2(apic_size) + audio + make_id3v1()
+
+
+def write_corpus(directory, scale=1.0):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, data in default_corpus(scale):
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as file:
+            file.write(data)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Writes synthetic MP3 corpus for benchmarks')
+    parser.add_argument('directory')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='stream length multiplier (1.0 = one minute)')
+    args = parser.parse_args()
+    for path in write_corpus(args.directory, args.scale):
+        print(path)
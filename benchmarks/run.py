@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    os.path.pardir)
+sys.path.append(ROOT)
+
+import corpus  # noqa: E402
+from decoder import decoder, frame, meta, sideinfo  # noqa: E402
+
+
+def measure(func, repeat):
+    """Returns (best wall time, peak traced memory) of func()"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def result(name, seconds, peak, items=None, size=None, **extra):
+    record = {'benchmark': name, 'seconds': seconds, 'peak_memory': peak}
+    if items is not None:
+        record['items'] = items
+        record['items_per_sec'] = items / seconds if seconds else None
+    if size is not None:
+        record['bytes'] = size
+        record['mb_per_sec'] = size / seconds / 2 ** 20 if seconds else None
+    record.update(extra)
+    return record
+
+
+def bench_decode(paths, repeat):
+    for path in paths:
+        def run():
+            with open(path, 'rb') as file:
+                return decoder.decode(file)
+
+        frames_count = len(run().frames)
+        seconds, peak = measure(run, repeat)
+        yield result('decoder.decode', seconds, peak, frames_count,
+                     os.path.getsize(path), file=os.path.basename(path))
+
+
+def bench_id3v2(repeat):
+    for apic_size in (0, 64 * 1024, 2 * 1024 * 1024):
+        tag = corpus.make_id3v2(apic_size)
+
+        def run():
+            meta.parse_id3v2(tag[:4], io.BytesIO(tag[4:]))
+
+        seconds, peak = measure(run, repeat)
+        yield result('meta.parse_id3v2', seconds, peak, 1, len(tag),
+                     apic_size=apic_size)
+
+
+def bench_sideinfo(repeat, number=20000):
+    cases = {
+        'mpeg1 stereo': (corpus.MPEG_1, corpus.STEREO),
+        'mpeg1 mono': (corpus.MPEG_1, corpus.MONO),
+        'mpeg2 joint stereo': (corpus.MPEG_2, corpus.JOINT_STEREO),
+        'mpeg25 mono': (corpus.MPEG_25, corpus.MONO),
+    }
+    for name, (standard, channel_mode) in cases.items():
+        header = frame.header_from_bytes(
+            corpus.make_header(standard, 9, channel_mode=channel_mode))
+        # arbitrary deterministic bytes, so every field gets non-zero values
+        data = bytes(i * 37 & 0xff for i in range(header.data_length))
+
+        def run():
+            for _ in range(number):
+                sideinfo.decode_sideinfo(header, data)
+
+        seconds, peak = measure(run, repeat)
+        yield result('sideinfo.decode_sideinfo', seconds, peak, number,
+                     case=name)
+
+
+def run_child(args):
+    """Runs command, returns (wall time, peak RSS in bytes) of this child
+    alone: RUSAGE_CHILDREN would give the largest child so far"""
+    started = time.perf_counter()
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args)
+    # ru_maxrss is in KiB on Linux
+    return elapsed, usage.ru_maxrss * 1024
+
+
+def bench_cli(paths, repeat):
+    cli = os.path.join(ROOT, 'mp3-cli.py')
+    for path in paths:
+        best = float('inf')
+        peak = 0
+        for _ in range(repeat):
+            elapsed, rss = run_child([sys.executable, cli, path])
+            best = min(best, elapsed)
+            peak = max(peak, rss)
+        yield result('mp3-cli.py', best, peak, None, os.path.getsize(path),
+                     file=os.path.basename(path), peak_is_rss=True)
+
+
+BENCHMARKS = ('decode', 'id3v2', 'sideinfo', 'cli')
+
+
+def run_benchmarks(paths, names, repeat):
+    if 'decode' in names:
+        yield from bench_decode(paths, repeat)
+    if 'id3v2' in names:
+        yield from bench_id3v2(repeat)
+    if 'sideinfo' in names:
+        yield from bench_sideinfo(repeat)
+    if 'cli' in names:
+        yield from bench_cli(paths, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Runs decoder benchmarks over synthetic corpus, '
+                    'prints JSON report')
+    parser.add_argument('--corpus', metavar='DIR',
+                        help='use existing corpus instead of generating one')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='generated stream length (1.0 = one minute)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS,
+                        default=BENCHMARKS)
+    parser.add_argument('--output', type=argparse.FileType('w'),
+                        default=sys.stdout)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.corpus:
+            paths = sorted(os.path.join(args.corpus, name)
+                           for name in os.listdir(args.corpus)
+                           if name.endswith('.mp3'))
+        else:
+            paths = corpus.write_corpus(directory, args.scale)
+        results = list(run_benchmarks(paths, args.only, args.repeat))
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'repeat': args.repeat,
+        'scale': args.scale,
+        'results': results,
+    }
+    json.dump(report, args.output, indent=2)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import asyncio
+import concurrent.futures
+import functools
+import os
+import queue
+
+from . import decoder
+
+CHUNK_SIZE = 1 << 16
+# Chunks of a stream buffered ahead of its parser
+MAX_CHUNKS = 16
+DEFAULT_CONCURRENCY = 16
+
+
+class ChunkFile:
+    """Blocking file-like object read by parser thread, fed with chunks of
+    async source from event loop. At most max_chunks chunks wait in queue,
+    so memory stays bounded and parsing overlaps reading"""
+
+    def __init__(self, loop, max_chunks=MAX_CHUNKS):
+        self.loop = loop
+        self.max_chunks = max_chunks
+        self.chunks = queue.Queue()
+        self.space = asyncio.Event()
+        self.pending = b''
+        self.pos = 0
+        self.eof = False
+        self.closed = False
+
+    async def feed(self, source, chunk_size=CHUNK_SIZE):
+        """Reads source until EOF or until parser closes file"""
+        try:
+            while not self.closed:
+                if self.chunks.qsize() >= self.max_chunks:
+                    self.space.clear()
+                    if self.chunks.qsize() >= self.max_chunks \
+                            and not self.closed:
+                        await self.space.wait()
+                    continue
+                chunk = await source.read(chunk_size)
+                if not chunk:
+                    break
+                self.chunks.put(chunk)
+        finally:
+            self.chunks.put(b'')
+
+    def read(self, size=-1):
+        whole = size is None or size < 0
+        if not whole and len(self.pending) - self.pos >= size:
+            self.pos += size
+            return self.pending[self.pos - size:self.pos]
+        parts = [self.pending[self.pos:]]
+        available = len(parts[0])
+        while not self.eof and (whole or available < size):
+            chunk = self.chunks.get()
+            self.loop.call_soon_threadsafe(self.space.set)
+            if not chunk:
+                self.eof = True
+            parts.append(chunk)
+            available += len(chunk)
+        # rest of the last chunk is served by offset, not copied
+        self.pending = b''.join(parts)
+        self.pos = len(self.pending) if whole else min(size, available)
+        return self.pending[:self.pos]
+
+    def close(self):
+        """Called from parser thread, stops feeding when parser is done
+        before EOF (probes read only the start of file)"""
+        self.closed = True
+        self.loop.call_soon_threadsafe(self.space.set)
+
+
+def parse_chunks(file_func, stream, kwargs):
+    try:
+        return file_func(stream, **kwargs)
+    finally:
+        stream.close()
+
+
+def decode_path(path, resync=True, tag_frames=None) -> decoder.File:
+    with open(path, 'rb') as file:
+        return decoder.decode(file, resync=resync, tag_frames=tag_frames)
+
+
+def probe_path(path, tag_frames=None) -> decoder.Probe:
+    with open(path, 'rb') as file:
+        return decoder.probe(file, tag_frames=tag_frames)
+
+
+async def run_parser(path_func, file_func, source, executor, **kwargs):
+    """Paths are opened and parsed in executor. Streams are read in event
+    loop chunk by chunk while a thread parses them, only MAX_CHUNKS chunks
+    are buffered per stream. Chunks can't be passed to another process, so
+    streams are parsed in loop default thread pool when executor is
+    ProcessPoolExecutor"""
+    loop = asyncio.get_running_loop()
+    if isinstance(source, (str, os.PathLike)):
+        return await loop.run_in_executor(
+            executor, functools.partial(path_func, source, **kwargs))
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        executor = None
+    stream = ChunkFile(loop)
+    parsed = loop.run_in_executor(
+        executor, parse_chunks, file_func, stream, kwargs)
+    try:
+        await stream.feed(source)
+    except BaseException:
+        stream.close()
+        parsed.cancel()
+        raise
+    return await parsed
+
+
+async def decode(source, executor=None, resync=True, tag_frames=None):
+    """Async decoder.decode. source is file path, asyncio.StreamReader or
+    async file-like object. executor = None uses loop default thread pool,
+    pass ProcessPoolExecutor to parse in parallel"""
+    return await run_parser(decode_path, decoder.decode, source, executor,
+                            resync=resync, tag_frames=tag_frames)
+
+
+async def probe(source, executor=None, tag_frames=None):
+    """Async decoder.probe, see decode for accepted sources"""
+    return await run_parser(probe_path, decoder.probe, source, executor,
+                            tag_frames=tag_frames)
+
+
+async def scan_many(sources, full=False, concurrency=DEFAULT_CONCURRENCY,
+                    executor=None, return_exceptions=True, **kwargs):
+    """Probes (or decodes with full=True) sources with at most concurrency
+    of them open at once. Returns results in sources order, errors are
+    returned in place of result unless return_exceptions=False"""
+    semaphore = asyncio.Semaphore(concurrency)
+    parse = decode if full else probe
+
+    async def scan(source):
+        async with semaphore:
+            return await parse(source, executor, **kwargs)
+
+    return await asyncio.gather(*map(scan, sources),
+                                return_exceptions=return_exceptions)
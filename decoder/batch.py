@@ -0,0 +1,89 @@
+import collections
+import functools
+import multiprocessing
+import os
+
+from . import decoder
+
+AUDIO_EXTENSIONS = ('.mp3',)
+NO_AUDIO_ERROR = 'No MPEG audio frames found'
+
+# Compact per-file result sent back from workers instead of File objects.
+# CRC counts are filled only by scans with verify=True
+ScanRecord = collections.namedtuple('ScanRecord', [
+    'path', 'size', 'frames', 'duration', 'bitrate', 'samplerate',
+    'channels', 'vbr', 'error', 'crc_protected', 'crc_failed',
+], defaults=(None, None))
+
+
+def iter_paths(paths, extensions=AUDIO_EXTENSIONS):
+    """Expands directories recursively, plain files are yielded as is"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(extensions):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def scan_file(path, full=False, verify=False) -> ScanRecord:
+    """Probes (or fully decodes with full=True) single file, verify=True
+    checks CRC of protected frames as well. Errors are returned in the
+    record, never raised"""
+    size = None
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            crc_counts = (None, None)
+            if verify:
+                report = decoder.verify_crc(file)
+                crc_counts = (report.protected, len(report.failed))
+                file.seek(0)
+            if full:
+                data = decoder.decode(file)
+                # Xing/Info/VBRI frame isn't counted, same as in probe
+                if not data.frames.audio_count:
+                    return ScanRecord(path, size, 0, 0.0, None, None, None,
+                                      None, NO_AUDIO_ERROR, *crc_counts)
+                header = data.frames.header(data.frames.audio_start)
+                frames = data.frames.audio_count
+                duration = data.duration
+                audio_length = sum(data.frames.lengths)
+                bitrate = audio_length * 8 / duration / 1000 \
+                    if duration else None
+                vbr = len({h.bitrate for h in data.frames.headers}) > 1
+            else:
+                # records carry no tags, so ID3v2 frames are skipped
+                info = decoder.probe(file, tag_frames=())
+                if not info.has_audio:
+                    return ScanRecord(path, size, 0, 0.0, None, None, None,
+                                      None, NO_AUDIO_ERROR, *crc_counts)
+                header = info.header
+                frames = info.frames_count
+                duration = info.duration
+                bitrate = info.bitrate
+                vbr = info.vbr_header is not None \
+                    and info.vbr_header.tag != b'Info'
+        return ScanRecord(path, size, frames, duration, bitrate,
+                          header.samplerate, header.channels_count(), vbr,
+                          None, *crc_counts)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except BaseException as e:
+        return ScanRecord(path, size, None, None, None, None, None, None,
+                          f'{type(e).__name__}: {e}')
+
+
+def scan_library(paths, jobs=None, full=False, chunksize=16, verify=False):
+    """Yields ScanRecord for every path in completion order. Files are
+    spread across a process pool of given size (cpu count by default),
+    jobs=1 scans in current process"""
+    scan = functools.partial(scan_file, full=full, verify=verify)
+    if jobs == 1:
+        yield from map(scan, paths)
+        return
+    with multiprocessing.Pool(jobs) as pool:
+        yield from pool.imap_unordered(scan, paths, chunksize)
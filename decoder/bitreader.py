@@ -0,0 +1,34 @@
+class BitReader:
+    """MSB-first bit reader over bytes-like object or int. The whole buffer
+    is held as one int, so it's meant for short fields like sideinfo"""
+
+    def __init__(self, data, bits=None):
+        if isinstance(data, int):
+            self.value = data
+            self.bits = bits
+        else:
+            self.value = int.from_bytes(data, 'big')
+            self.bits = len(data) * 8
+        self.pos = 0
+
+    def read(self, count):
+        self.pos += count
+        shift = self.bits - self.pos
+        if shift < 0:
+            raise EOFError(f'Tried to read {count} bits, '
+                           f'only {count + shift} available')
+        return (self.value >> shift) & ((1 << count) - 1)
+
+    def peek(self, count):
+        """Next count bits without consuming them, zero-padded past end"""
+        shift = self.bits - self.pos - count
+        if shift < 0:
+            return (self.value << -shift) & ((1 << count) - 1)
+        return (self.value >> shift) & ((1 << count) - 1)
+
+    def skip(self, count):
+        self.pos += count
+
+    @property
+    def remaining(self):
+        return self.bits - self.pos
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from . import decoder, frame, index, meta
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'mp3-parser')
+DEFAULT_MAX_SIZE = 256 * 2 ** 20
+
+MAGIC = b'MP3IDX'
+VERSION = 3
+BYTEORDER = {'little': 0, 'big': 1}[sys.byteorder]
+
+# magic, version, byteorder, frames count, header patterns count,
+# tags json length, album image length, duration, first audio frame
+HEADER = struct.Struct('<6sHBIIIIdB')
+
+ID3V1_FIELDS = ('title', 'artist', 'album', 'year', 'comment', 'genre')
+ID3V2_FIELDS = ('title', 'compositor', 'performer_1', 'year', 'album',
+                'track', 'encoder', 'copyright', 'comment', 'lyrics')
+
+
+class FrameIndexCache:
+    """On-disk cache of frame index and parsed tags, keyed by file path,
+    size, mtime and inode. Least recently used entries are evicted once
+    the directory grows over max_size bytes"""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY,
+                 max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def entry_path(self, path):
+        stat = os.stat(path)
+        key = '\0'.join(map(str, (os.path.abspath(path), stat.st_size,
+                                  stat.st_mtime_ns, stat.st_ino)))
+        name = hashlib.sha1(key.encode('utf-8', 'surrogateescape'))
+        return os.path.join(self.directory, name.hexdigest() + '.idx')
+
+    def decode(self, path) -> decoder.File:
+        """Returns cached File or decodes file and stores it"""
+        data = self.get(path)
+        if data is None:
+            with open(path, 'rb') as file:
+                data = decoder.decode(file)
+            self.put(path, data)
+        return data
+
+    def get(self, path):
+        entry = self.entry_path(path)
+        try:
+            with open(entry, 'rb') as file:
+                data = load(file)
+        except (OSError, EOFError, ValueError, struct.error):
+            return None
+        if data is not None:
+            os.utime(entry)
+        return data
+
+    def put(self, path, data: decoder.File):
+        entry = self.entry_path(path)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                dump(data, file)
+            os.replace(tmp_path, entry)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        evict(self.directory, self.max_size, '.idx')
+
+
+def evict(directory, max_size, suffix):
+    """Removes least recently used files with suffix until directory holds
+    at most max_size bytes of them"""
+    entries = []
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.name.endswith(suffix):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_size:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def dump(data: decoder.File, file):
+    frames = data.frames
+    tags = {}
+    album_image = b''
+    if data.meta_id3v1:
+        tags['id3v1'] = {name: getattr(data.meta_id3v1, name)
+                         for name in ID3V1_FIELDS}
+        tags['id3v1']['year'] = bytes(data.meta_id3v1.year).decode('latin-1')
+        tags['id3v1']['offset'] = data.meta_id3v1.offset
+    if data.meta_id3v2:
+        tag = data.meta_id3v2
+        tags['id3v2'] = {name: getattr(tag, name) for name in ID3V2_FIELDS}
+        tags['id3v2'].update(version=tag.version, flags=tag.flags,
+                             offset=tag.offset)
+        album_image = bytes(tag.album_image_bytes or b'')
+    tags_json = json.dumps(tags).encode('utf-8')
+
+    file.write(HEADER.pack(MAGIC, VERSION, BYTEORDER, len(frames),
+                           len(frames.headers), len(tags_json),
+                           len(album_image), frames.duration,
+                           frames.audio_start))
+    file.write(b''.join(header.raw for header in frames.headers))
+    for column in (frames.offsets, frames.lengths, frames.times,
+                   frames.header_ids):
+        column.tofile(file)
+    file.write(tags_json)
+    file.write(album_image)
+
+
+def load(file):
+    """Returns decoder.File or None if file isn't a compatible cache entry"""
+    (magic, version, byteorder, frames_count, headers_count, tags_length,
+     image_length, duration, audio_start) = \
+        HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION or byteorder != BYTEORDER:
+        return None
+
+    raw_headers = file.read(headers_count * 4)
+    headers = [frame.header_from_bytes(raw_headers[i:i + 4])
+               for i in range(0, len(raw_headers), 4)]
+    columns = []
+    for typecode in ('Q', 'I', 'd', 'H'):
+        column = array(typecode)
+        column.fromfile(file, frames_count)
+        columns.append(column)
+    offsets, lengths, times, header_ids = columns
+
+    data = decoder.File()
+    data.frames = index.FrameIndex.from_columns(
+        headers, offsets, lengths, times, header_ids, duration,
+        audio_start)
+
+    tags = json.loads(file.read(tags_length).decode('utf-8'))
+    if 'id3v1' in tags:
+        fields = tags['id3v1']
+        genre = meta.GENRES.index(fields['genre']) \
+            if fields['genre'] in meta.GENRES else 255
+        data.meta_id3v1 = meta.MetaID3V1(
+            *(fields[name].encode('latin-1') for name in ID3V1_FIELDS[:-1]),
+            genre)
+        data.meta_id3v1.offset = fields['offset']
+    if 'id3v2' in tags:
+        fields = tags['id3v2']
+        tag = meta.MetaID3V2(fields['version'], fields['flags'])
+        for name in ID3V2_FIELDS:
+            setattr(tag, name, fields[name])
+        tag.offset = fields['offset']
+        if image_length:
+            tag.album_image_bytes = file.read(image_length)
+        data.meta_id3v2 = tag
+    return data
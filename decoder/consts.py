@@ -58,4 +58,91 @@ SCALE_FACTOR_INDICES = {
          126, 156, 194, 240, 296, 364, 448, 550, 576],
         [0, 4, 8, 12, 16, 22, 30, 42, 58, 78, 104, 138, 180, 192]
     ),
+    22050: (
+        [0, 6, 12, 18, 24, 30, 36, 44, 54, 66, 80, 96, 116, 140,
+         168, 200, 238, 284, 336, 396, 464, 522, 576],
+        [0, 4, 8, 12, 18, 24, 32, 42, 56, 74, 100, 132, 174, 192]
+    ),
+    24000: (
+        [0, 6, 12, 18, 24, 30, 36, 44, 54, 66, 80, 96, 114, 136,
+         162, 194, 232, 278, 332, 394, 464, 540, 576],
+        [0, 4, 8, 12, 18, 26, 36, 48, 62, 80, 104, 136, 180, 192]
+    ),
+    16000: (
+        [0, 6, 12, 18, 24, 30, 36, 44, 54, 66, 80, 96, 116, 140,
+         168, 200, 238, 284, 336, 396, 464, 522, 576],
+        [0, 4, 8, 12, 18, 26, 36, 48, 62, 80, 104, 134, 174, 192]
+    ),
+    11025: (
+        [0, 6, 12, 18, 24, 30, 36, 44, 54, 66, 80, 96, 116, 140,
+         168, 200, 238, 284, 336, 396, 464, 522, 576],
+        [0, 4, 8, 12, 18, 26, 36, 48, 62, 80, 104, 134, 174, 192]
+    ),
+    12000: (
+        [0, 6, 12, 18, 24, 30, 36, 44, 54, 66, 80, 96, 116, 140,
+         168, 200, 238, 284, 336, 396, 464, 522, 576],
+        [0, 4, 8, 12, 18, 26, 36, 48, 62, 80, 104, 134, 174, 192]
+    ),
+    8000: (
+        [0, 12, 24, 36, 48, 60, 72, 88, 108, 132, 160, 192, 232, 280,
+         336, 400, 476, 566, 568, 570, 572, 574, 576],
+        [0, 8, 16, 24, 36, 52, 72, 96, 124, 160, 162, 164, 166, 192]
+    ),
 }
+
+# Layer III scalefactors
+
+# MPEG 1 scalefac_compress -> (slen1, slen2)
+SCALEFAC_SIZES = [
+    (0, 0), (0, 1), (0, 2), (0, 3), (3, 0), (1, 1), (1, 2), (1, 3),
+    (2, 1), (2, 2), (2, 3), (3, 1), (3, 2), (3, 3), (4, 2), (4, 3),
+]
+
+# MPEG 1 scfsi groups of long block scalefactor bands
+SCFSI_BANDS = [(0, 6), (6, 11), (11, 16), (16, 21)]
+
+# MPEG 2/2.5 scalefactors per partition: [table][long, short, mixed]
+LSF_PARTITIONS = [
+    [(6, 5, 5, 5), (9, 9, 9, 9), (6, 9, 9, 9)],
+    [(6, 5, 7, 3), (9, 9, 12, 6), (6, 9, 12, 6)],
+    [(11, 10, 0, 0), (18, 18, 0, 0), (15, 18, 0, 0)],
+    [(7, 7, 7, 0), (12, 12, 12, 0), (6, 15, 12, 0)],
+    [(6, 6, 6, 3), (12, 9, 9, 6), (6, 12, 9, 6)],
+    [(8, 8, 5, 0), (15, 12, 9, 0), (6, 18, 9, 0)],
+]
+
+PRETAB = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 3, 3, 3, 2, 0]
+
+# Layer III synthesis
+
+# Antialias butterfly coefficients c[i]
+ANTIALIAS_COEFFICIENTS = [-0.6, -0.535, -0.33, -0.185, -0.095, -0.041,
+                          -0.0142, -0.0037]
+
+# Polyphase synthesis window prototype for D[0..256] in 1/65536 units. It
+# is symmetric around 256, D[i] takes it with sign flipped in every odd
+# block of 64
+SYNTHESIS_WINDOW = [
+    0, -1, -1, -1, -1, -1, -1, -2, -2, -2, -2, -3, -3, -4, -4, -5, -5, -6, -7,
+    -7, -8, -9, -10, -11, -13, -14, -16, -17, -19, -21, -24, -26, -29, -31,
+    -35, -38, -41, -45, -49, -53, -58, -63, -68, -73, -79, -85, -91, -97,
+    -104, -111, -117, -125, -132, -139, -147, -154, -161, -169, -176, -183,
+    -190, -196, -202, -208, -213, -218, -222, -225, -227, -228, -228, -227,
+    -224, -221, -215, -208, -200, -189, -177, -163, -146, -127, -106, -83,
+    -57, -29, 2, 36, 72, 111, 153, 197, 244, 294, 347, 401, 459, 519, 581,
+    645, 711, 779, 848, 919, 991, 1064, 1137, 1210, 1283, 1356, 1428, 1498,
+    1567, 1634, 1698, 1759, 1817, 1870, 1919, 1962, 2001, 2032, 2057, 2075,
+    2085, 2087, 2080, 2063, 2037, 2000, 1952, 1893, 1822, 1739, 1644, 1535,
+    1414, 1280, 1131, 970, 794, 605, 402, 185, -45, -288, -545, -814, -1095,
+    -1388, -1692, -2006, -2330, -2663, -3004, -3351, -3705, -4063, -4425,
+    -4788, -5153, -5517, -5879, -6237, -6589, -6935, -7271, -7597, -7910,
+    -8209, -8491, -8755, -8998, -9219, -9416, -9585, -9727, -9838, -9916,
+    -9959, -9966, -9935, -9863, -9750, -9592, -9389, -9139, -8840, -8492,
+    -8092, -7640, -7134, -6574, -5959, -5288, -4561, -3776, -2935, -2037,
+    -1082, -70, 998, 2122, 3300, 4533, 5818, 7154, 8540, 9975, 11455, 12980,
+    14548, 16155, 17799, 19478, 21189, 22929, 24694, 26482, 28289, 30112,
+    31947, 33791, 35640, 37489, 39336, 41176, 43006, 44821, 46617, 48390,
+    50137, 51853, 53534, 55178, 56778, 58333, 59838, 61289, 62684, 64019,
+    65290, 66494, 67629, 68692, 69679, 70590, 71420, 72169, 72835, 73415,
+    73908, 74313, 74630, 74856, 74992, 75038,
+]
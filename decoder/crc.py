@@ -0,0 +1,129 @@
+from enum import Enum
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# CRC-16 of protected frames: x^16 + x^15 + x^2 + 1, MSB first, starts
+# with all ones and covers the last two header bytes and the side info
+POLYNOMIAL = 0x8005
+INIT = 0xffff
+
+
+class CrcMode(Enum):
+    # CRC word is stepped over, not checked
+    Skip = 0
+    # mismatching frames are reported and kept
+    Verify = 1
+    # mismatching frames are reported and replaced by sync.Skipped
+    Drop = 2
+
+
+def make_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = (crc << 1 ^ POLYNOMIAL) if crc & 0x8000 else crc << 1
+        table.append(crc & 0xffff)
+    return table
+
+
+TABLE = make_table()
+
+
+def crc16(data, crc=INIT):
+    table = TABLE
+    for byte in data:
+        crc = (crc << 8 & 0xff00) ^ table[crc >> 8 ^ byte]
+    return crc
+
+
+def check(raw_header, data, length) -> bool:
+    """data = frame bytes after the 4-byte header: big-endian CRC word
+    followed by length protected bytes"""
+    crc = crc16(data[2:2 + length], crc16(raw_header[2:4]))
+    return crc == data[0] << 8 | data[1]
+
+
+def crc16_rows(rows):
+    """rows = (n, length) uint8 array, returns CRC of every row. Loops over
+    columns, so n frames cost length numpy operations"""
+    table = numpy.array(TABLE, dtype=numpy.uint16)
+    crc = numpy.full(len(rows), INIT, dtype=numpy.uint16)
+    for column in rows.T:
+        crc = (crc << 8) ^ table[(crc >> 8) ^ column]
+    return crc
+
+
+def verify_frames(buffer, frames, report=None):
+    """Checks all protected frames of index.FrameIndex over buffer (bytes or
+    mmap of the whole file) in one numpy pass per protected length. Returns
+    IntegrityReport"""
+    if numpy is None:
+        raise BaseException('numpy is not installed')
+    report = report if report is not None else IntegrityReport()
+    data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+    offsets, _, header_ids = frames.as_numpy()
+    offsets = offsets.astype(numpy.intp)
+    # protected length of every header pattern: -1 unprotected, 0 unchecked
+    covered = numpy.array([
+        -1 if not header.protection else header.crc_length() or 0
+        for header in frames.headers], dtype=numpy.intp)
+    frame_covered = covered[header_ids]
+
+    report.protected += int(numpy.count_nonzero(frame_covered >= 0))
+    report.unchecked += int(numpy.count_nonzero(frame_covered == 0))
+    failed = []
+    for length in numpy.unique(covered[covered > 0]):
+        selected = offsets[frame_covered == length]
+        # truncated last frame is counted as unchecked
+        complete = selected + 6 + length <= len(data)
+        report.unchecked += int(numpy.count_nonzero(~complete))
+        selected = selected[complete]
+        positions = numpy.concatenate(([2, 3], 6 + numpy.arange(length)))
+        rows = data[selected[:, None] + positions]
+        stored = data[selected + 4].astype(numpy.uint16) << 8 \
+            | data[selected + 5]
+        failed.append(selected[crc16_rows(rows) != stored])
+    if failed:
+        report.failed.extend(int(offset) for offset
+                             in numpy.sort(numpy.concatenate(failed)))
+    return report
+
+
+class IntegrityReport:
+    """CRC results of one file: failed holds offsets of mismatching frames.
+    Protected Layer I/II frames are counted as unchecked, their CRC covers
+    bit allocation which isn't parsed"""
+
+    def __init__(self):
+        self.protected = 0
+        self.unchecked = 0
+        self.failed = []
+
+    @property
+    def passed(self):
+        return self.protected - self.unchecked - len(self.failed)
+
+    def add(self, offset, ok):
+        """ok = True/False, None for unchecked frame"""
+        self.protected += 1
+        if ok is None:
+            self.unchecked += 1
+        elif not ok:
+            self.failed.append(offset)
+
+    def as_dict(self):
+        return {'protected': self.protected, 'passed': self.passed,
+                'unchecked': self.unchecked, 'failed': self.failed}
+
+    def print(self):
+        print(f"CRC protected frames: {self.protected}, passed: "
+              f"{self.passed}, unchecked: {self.unchecked}, "
+              f"failed: {len(self.failed)}")
+        for offset in self.failed[:10]:
+            print(f"CRC mismatch in frame at offset {offset}")
+        if len(self.failed) > 10:
+            print("... (Output truncated to first 10 mismatches)")
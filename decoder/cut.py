@@ -0,0 +1,176 @@
+import errno
+import os
+import struct
+
+from . import decoder, meta
+
+# errors of kernel copy calls that mean "use the next method"
+UNSUPPORTED = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP,
+               errno.ENOTSUP, errno.EBADF)
+CHUNK_SIZE = 1 << 20
+ID3V1_SIZE = 128
+ID3V2_FOOTER_FLAG = 0x10
+
+
+def copy_file_range(src, dst, offset, length):
+    return os.copy_file_range(src, dst, length, offset)
+
+
+def sendfile(src, dst, offset, length):
+    return os.sendfile(dst, src, offset, length)
+
+
+def read_write(src, dst, offset, length):
+    data = os.pread(src, min(length, CHUNK_SIZE), offset)
+    written = 0
+    while written < len(data):
+        written += os.write(dst, data[written:])
+    return len(data)
+
+
+# Methods available on this platform in order of preference
+COPY_METHODS = tuple(method for method, name in (
+    (copy_file_range, 'copy_file_range'), (sendfile, 'sendfile'))
+    if hasattr(os, name))
+
+
+def copy_range(src, dst, offset, length, methods=None):
+    """src, dst = file descriptors. Copies length bytes at offset of src to
+    current position of dst. Data stays in the kernel unless neither
+    copy_file_range nor sendfile work for these files. methods = list of
+    methods left to try for this pair of files, the ones failing for it are
+    removed, so it can be shared by copies between the same files"""
+    methods = list(COPY_METHODS) if methods is None else methods
+    while length > 0:
+        copied = None
+        for method in list(methods):
+            try:
+                copied = method(src, dst, offset, length)
+                break
+            except OSError as e:
+                if e.errno not in UNSUPPORTED:
+                    raise
+                methods.remove(method)
+        if copied is None:
+            copied = read_write(src, dst, offset, length)
+        if not copied:
+            raise EOFError('Source file is shorter than its frame index')
+        offset += copied
+        length -= copied
+
+
+class Source:
+    """Parsed file opened for cutting: frame index, byte ranges of tags and
+    number of the first audio frame (Xing/Info/VBRI frame is left out, its
+    counts would be wrong for any part of the file)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.data = decoder.decode(file, tag_frames=())
+        self.fd = os.open(path, os.O_RDONLY)
+        try:
+            self.id3v2 = self.id3v2_range()
+            self.id3v1 = (self.data.meta_id3v1.offset, ID3V1_SIZE) \
+                if self.data.meta_id3v1 else None
+            # times of the index start after Xing/Info/VBRI frame
+            self.first_frame = self.data.frames.audio_start
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def frames_count(self):
+        return len(self.data.frames)
+
+    def id3v2_range(self):
+        tag = self.data.meta_id3v2
+        if not tag:
+            return None
+        raw = os.pread(self.fd, meta.ID3V2_HEADER_SIZE, tag.offset)
+        _, flags, safe_size = struct.unpack('>HBI', raw[3:])
+        length = meta.ID3V2_HEADER_SIZE + meta.decode_synchsafe(safe_size)
+        if tag.version == 0x0400 and flags & ID3V2_FOOTER_FLAG:
+            length += meta.ID3V2_HEADER_SIZE
+        return tag.offset, length
+
+    def frame_at(self, position, frames=False):
+        """Frame boundary of position given in seconds (measured from the
+        first audio frame) or frame numbers. Time maps to the frame playing
+        at it, so parts of a split meet without gaps or overlaps"""
+        if position is None:
+            return None
+        if frames:
+            number = int(position)
+        elif position >= self.data.duration:
+            number = self.frames_count
+        else:
+            number = self.data.frames.frame_at(position)
+        return max(self.first_frame, min(number, self.frames_count))
+
+    def write(self, output, start=None, end=None, tags=True):
+        """Writes frames [start, end) to output path, framed by the source
+        ID3v2 and ID3v1 tags when tags=True. Returns (start, end)"""
+        start = self.first_frame if start is None else start
+        end = self.frames_count if end is None else end
+        if end <= start:
+            raise BaseException(f'Empty range of frames {start}-{end}')
+        frames = self.data.frames
+        ranges = []
+        if tags and self.id3v2:
+            ranges.append(self.id3v2)
+        audio_start = frames.offsets[start]
+        ranges.append((audio_start, frames.offsets[end - 1]
+                       + frames.lengths[end - 1] - audio_start))
+        if tags and self.id3v1:
+            ranges.append(self.id3v1)
+
+        dst = os.open(output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        methods = list(COPY_METHODS)
+        try:
+            for offset, length in ranges:
+                copy_range(self.fd, dst, offset, length, methods)
+        finally:
+            os.close(dst)
+        return start, end
+
+
+def cut(path, output, start=None, end=None, frames=False, tags=True):
+    """Copies part of path between start and end (seconds, or frame numbers
+    with frames=True, None = file edges) to output without re-encoding.
+    Returns the (start, end) frame range written. First frame may reference
+    bit reservoir of a frame left out, decoders play it as a short
+    silence"""
+    with Source(path) as source:
+        return source.write(output, source.frame_at(start, frames),
+                            source.frame_at(end, frames), tags)
+
+
+def split(path, points, template=None, frames=False, tags=True):
+    """Splits path at points (seconds or frame numbers) into len(points) + 1
+    files named by template.format(stem=, index=, suffix=), by default
+    '{stem}-{index:03d}{suffix}' next to the source. Returns output paths"""
+    stem, suffix = os.path.splitext(path)
+    template = template or '{stem}-{index:03d}{suffix}'
+    outputs = []
+    with Source(path) as source:
+        bounds = [source.first_frame] \
+            + sorted(source.frame_at(point, frames) for point in points) \
+            + [source.frames_count]
+        for first, last in zip(bounds, bounds[1:]):
+            if last <= first:
+                continue
+            output = template.format(stem=stem, index=len(outputs) + 1,
+                                     suffix=suffix)
+            source.write(output, first, last, tags)
+            outputs.append(output)
+    return outputs
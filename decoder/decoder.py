@@ -1,42 +1,309 @@
-from . import meta, frame
+import os
 
+from . import crc, meta, frame, index, reader, sync
 
-def decode(file):
+
+def decode(file, use_mmap=True, resync=True, tag_frames=None,
+           crc_mode=crc.CrcMode.Skip):
+    """Parses file object. Regular files are memory-mapped and walked over
+    memoryview slices, other streams (pipes, sockets, BytesIO) are read
+    sequentially. Pass use_mmap=False to force sequential reads.
+    Junk between frames is skipped and listed in File.skipped, with
+    resync=False it raises instead. ID3v2 frames are decoded lazily on
+    access (their bytes are copied out of the mapping, which is closed
+    once parsing ends), tag_frames limits them to given set of frame ids.
+    crc_mode other than Skip fills File.integrity"""
     decoded_file = File()
-    frame_decoder = frame.FrameDecoder()
+    if crc_mode != crc.CrcMode.Skip:
+        decoded_file.integrity = crc.IntegrityReport()
+    for item in iter_frames(file, use_mmap, resync=resync,
+                            tag_frames=tag_frames, crc_mode=crc_mode,
+                            integrity=decoded_file.integrity):
+        decoded_file.append(item)
+    return decoded_file
+
+
+def iter_frames(file, use_mmap=True, headers_only=False, resync=True,
+                tag_frames=None, decode_audio=False,
+                crc_mode=crc.CrcMode.Skip, integrity=None):
+    """Yields frame.Frame, meta.MetaID3V1, meta.MetaID3V2 and sync.Skipped
+    objects in file order without keeping them. With headers_only=True
+    frame payloads are skipped instead of parsed (no sideinfo/Xing
+    decoding), decode_audio=True decodes Layer III main data as well.
+    crc_mode Verify/Drop checks CRC of protected frames (results go to
+    integrity, crc.IntegrityReport), Drop yields frames that fail it as
+    sync.Skipped"""
+    stream = open_stream(file, use_mmap)
+    try:
+        for item in iter_stream(stream, headers_only, resync, tag_frames,
+                                decode_audio, crc_mode, integrity):
+            if isinstance(item, meta.MetaID3V2):
+                # detached before the caller sees it: consumers may hand
+                # the tag to other threads, which decode its frames
+                item.detach(file_path(file), tag_frames)
+            yield item
+    finally:
+        close_stream(file, stream)
+
+
+def iter_stream(file, headers_only=False, resync=True, tag_frames=None,
+                decode_audio=False, crc_mode=crc.CrcMode.Skip,
+                integrity=None):
+    frame_decoder = frame.FrameDecoder(decode_audio, crc_mode, integrity)
 
-    i = 0
     while True:
-        header_bytes = file.read(4)
+        offset = file.tell()
+        header_bytes = bytes(file.read(4))
 
         if not header_bytes:
             break
 
         if header_bytes.startswith(meta.ID3V2_MAGIC):
-            metadata = meta.parse_id3v2(header_bytes, file)
-            decoded_file.meta_id3v2 = metadata
-        elif header_bytes.startswith(frame.SYNC_WORD):
-            framedata = frame_decoder.parse_frame(header_bytes, file)
-            decoded_file.append_frame(framedata)
-            if i == 2:
-                break
+            metadata = meta.parse_id3v2(header_bytes, file,
+                                        wanted=tag_frames)
+            metadata.offset = offset
+            yield metadata
+        elif sync.is_valid_header(header_bytes):
+            truncated_at = file.find_truncation(
+                offset, frame.header_from_bytes(header_bytes).frame_length)
+            if truncated_at >= 0:
+                file.seek(truncated_at)
+                frame_decoder.discontinuity()
+                yield sync.Skipped(offset, truncated_at - offset,
+                                   'truncated frame')
             else:
-                pass
-                # i += 1
+                if headers_only:
+                    parsed = frame_decoder.skip_frame(header_bytes, file,
+                                                      offset)
+                else:
+                    parsed = frame_decoder.parse_frame(header_bytes, file,
+                                                       offset)
+                if parsed.crc_ok is False \
+                        and crc_mode == crc.CrcMode.Drop:
+                    yield sync.Skipped(offset, parsed.header.frame_length,
+                                       'CRC mismatch')
+                else:
+                    yield parsed
         elif header_bytes.startswith(meta.ID3V1_MAGIC):
             metadata = meta.parse_id3v1(header_bytes, file)
-            decoded_file.meta_id3v1 = metadata
+            metadata.offset = offset
+            yield metadata
+        elif header_bytes == sync.APE_MAGIC[:4]:
+            ape_header = header_bytes + bytes(
+                file.read(sync.APE_HEADER_SIZE - 4))
+            if ape_header.startswith(sync.APE_MAGIC) \
+                    and len(ape_header) == sync.APE_HEADER_SIZE:
+                length = sync.ape_tag_length(ape_header)
+                file.skip(length)
+                yield sync.Skipped(offset, sync.APE_HEADER_SIZE + length,
+                                   'APE tag')
+            else:
+                frame_decoder.discontinuity()
+                yield skip_junk(file, offset, ape_header, resync)
         else:
-            raise BaseException('Unknown header bytes!', header_bytes)
+            frame_decoder.discontinuity()
+            yield skip_junk(file, offset, header_bytes, resync)
 
-    return decoded_file
+
+def skip_junk(file, offset, data, resync=True) -> sync.Skipped:
+    """data = bytes read at offset that didn't start frame or tag"""
+    if not resync:
+        raise BaseException('Unknown header bytes!', data[:4])
+    file.unread(data)
+    skipped = file.resync()
+    if not skipped:
+        file.skip(1)
+        skipped = 1
+    return sync.Skipped(offset, skipped)
+
+
+def open_stream(file, use_mmap=True):
+    mapped = reader.map_file(file) if use_mmap else None
+    return mapped if mapped is not None else reader.StreamReader(file)
+
+
+def file_path(file):
+    """Absolute path of file object opened by name, else None"""
+    name = getattr(file, 'name', None)
+    if isinstance(name, (str, bytes, os.PathLike)):
+        return os.path.abspath(name)
+    return None
+
+
+def close_stream(file, stream):
+    """Moves file to where mapped stream stopped and unmaps it"""
+    if isinstance(stream, reader.MemoryReader):
+        file.seek(stream.tell())
+        stream.close()
+
+
+def probe(file, use_mmap=True, tag_frames=None):
+    """Returns Probe with duration, frames count and average bitrate. Reads
+    ID3v2 tag and first frame only when it carries Xing/Info/VBRI header,
+    otherwise falls back to headers-only scan. Probe.has_audio is False
+    when no frame is found"""
+    stream = open_stream(file, use_mmap)
+    try:
+        info = probe_stream(stream, tag_frames)
+        if info.meta_id3v2:
+            info.meta_id3v2.detach(file_path(file), tag_frames)
+        return info
+    finally:
+        close_stream(file, stream)
+
+
+def probe_stream(stream, tag_frames=None):
+    frame_decoder = frame.FrameDecoder()
+    info = Probe()
+
+    offset = stream.tell()
+    header_bytes = bytes(stream.read(4))
+    if header_bytes.startswith(meta.ID3V2_MAGIC):
+        info.meta_id3v2 = meta.parse_id3v2(header_bytes, stream,
+                                           wanted=tag_frames)
+        info.meta_id3v2.offset = offset
+        header_bytes = bytes(stream.read(4))
+    if not sync.is_valid_header(header_bytes):
+        stream.unread(header_bytes)
+        stream.resync()
+        header_bytes = bytes(stream.read(4))
+        if not sync.is_valid_header(header_bytes):
+            return info
+
+    info.audio_offset = stream.tell() - 4
+    first = frame_decoder.parse_frame(header_bytes, stream, info.audio_offset)
+    info.header = first.header
+    vbr = frame_decoder.first_frame_data
+    info.vbr_header = vbr
+
+    if vbr is not None and vbr.frames_count:
+        info.frames_count = vbr.frames_count
+        audio_end = None
+        if isinstance(stream, reader.MemoryReader):
+            audio_end = len(stream)
+            if bytes(stream.view[-128:-125]) == meta.ID3V1_MAGIC:
+                audio_end -= 128
+        info.audio_length = vbr.file_length or (
+            audio_end - info.audio_offset if audio_end else None)
+    else:
+        info.scanned = True
+        info.frames_count = 1
+        info.audio_length = first.header.frame_length
+        for item in iter_stream(stream, headers_only=True):
+            if isinstance(item, frame.Frame):
+                info.frames_count += 1
+                info.audio_length += item.header.frame_length
+            elif isinstance(item, meta.MetaID3V1):
+                info.meta_id3v1 = item
+    info.duration = info.frames_count * info.header.frame_size \
+        / info.header.samplerate
+    if info.audio_length and info.duration:
+        info.bitrate = info.audio_length * 8 / info.duration / 1000
+    return info
+
+
+class Probe:
+    def __init__(self):
+        self.header: frame.Header = None
+        self.vbr_header: frame.FirstFrameData = None
+        self.meta_id3v1 = None
+        self.meta_id3v2 = None
+        self.audio_offset = None
+        self.audio_length = None
+        self.frames_count = 0
+        self.duration = 0.0
+        self.bitrate = None
+        self.scanned = False
+
+    @property
+    def has_audio(self):
+        return self.header is not None
+
+    def seek_offset(self, seconds):
+        """Approximate byte offset of given time from Xing TOC (or linear
+        interpolation when there is no TOC)"""
+        if not self.duration or not self.audio_length:
+            return self.audio_offset
+        percent = min(max(seconds / self.duration * 100, 0.0), 99.999)
+        toc = self.vbr_header.toc if self.vbr_header else None
+        if toc and len(toc) == 100:
+            lo = toc[int(percent)]
+            hi = toc[int(percent) + 1] if int(percent) < 99 else 256
+            scaled = lo + (hi - lo) * (percent - int(percent))
+            position = scaled / 256
+        else:
+            position = percent / 100
+        return self.audio_offset + int(position * self.audio_length)
+
+    def print(self):
+        print("Duration:", round(self.duration, 3), "s")
+        print("Frames count:", self.frames_count)
+        if self.bitrate:
+            print("Average bitrate:", round(self.bitrate, 1), "kbps")
+        print("VBR header:", self.vbr_header.tag if self.vbr_header
+              else None)
+
+
+def verify_crc(file, use_mmap=True) -> crc.IntegrityReport:
+    """Checks CRC of all protected frames at about headers-only scan speed:
+    memory-mapped files are indexed first and then checked in one numpy
+    pass (crc.verify_frames), other streams frame by frame"""
+    stream = open_stream(file, use_mmap)
+    report = crc.IntegrityReport()
+    try:
+        if isinstance(stream, reader.MemoryReader) \
+                and crc.numpy is not None:
+            frames = index.FrameIndex()
+            for item in iter_stream(stream, headers_only=True,
+                                    tag_frames=()):
+                if isinstance(item, frame.Frame):
+                    frames.append(item)
+            return crc.verify_frames(stream.buffer, frames, report)
+        for _ in iter_stream(stream, headers_only=True, tag_frames=(),
+                             crc_mode=crc.CrcMode.Verify, integrity=report):
+            pass
+        return report
+    finally:
+        close_stream(file, stream)
+
+
+def count_frames(file, use_mmap=True):
+    """Counts frames reading only headers"""
+    return sum(1 for item in iter_frames(file, use_mmap, headers_only=True)
+               if isinstance(item, frame.Frame))
 
 
 class File:
     def __init__(self):
-        self.frames: list = []
+        self.frames: index.FrameIndex = index.FrameIndex()
         self.meta_id3v1 = None
         self.meta_id3v2 = None
+        self.skipped = []
+        # crc.IntegrityReport when decoded with CRC checks
+        self.integrity = None
+
+    @property
+    def skipped_bytes(self):
+        return sum(skipped.length for skipped in self.skipped)
+
+    @property
+    def duration(self):
+        return self.frames.duration
+
+    def seek(self, seconds):
+        """Returns (frame, byte offset) of frame playing at given time"""
+        i, offset = self.frames.seek(seconds)
+        return self.frames[i], offset
+
+    def append(self, item):
+        if isinstance(item, frame.Frame):
+            self.append_frame(item)
+        elif isinstance(item, meta.MetaID3V2):
+            self.meta_id3v2 = item
+        elif isinstance(item, meta.MetaID3V1):
+            self.meta_id3v1 = item
+        elif isinstance(item, sync.Skipped):
+            self.skipped.append(item)
 
     def append_frame(self, framedata: frame.Frame):
         self.frames.append(framedata)
@@ -1,6 +1,6 @@
 import struct
 
-from . import sideinfo, consts
+from . import crc, reservoir, sideinfo, consts
 
 SYNC_WORD = b'\xff'
 
@@ -36,9 +36,14 @@ SAMPLE_COLUMN_MAP = {
 
 
 class Header:
+    """Decoded frame header. Instances are shared between all frames with
+    the same raw header bytes (see header_from_bytes), so they are frozen
+    after construction"""
+
     def __init__(self, standart, layer, protection, bitrate, samplerate,
                  padding, private, channel_mode, extension, copyright,
-                 is_original, emphasis):
+                 is_original, emphasis, raw=None):
+        self.raw = raw
         self.standart = consts.Standards(standart)
         self.layer = layer
         self.protection = not bool(protection)
@@ -54,6 +59,12 @@ class Header:
 
         self.frame_size = self.calc_frame_size()
         self.frame_length = self.calc_frame_length()
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError(f'Header is immutable, can not set {name}')
+        super().__setattr__(name, value)
 
     def print(self):
         print_standart(self.standart)
@@ -93,74 +104,227 @@ class Header:
                 return 32
         else:
             if self.channel_mode == consts.ChannelMode.Mono:
-                return 8
+                return 9
             else:
                 return 17
 
+    def crc_length(self):
+        """Bytes after CRC word covered by it (side info), None for Layer
+        I/II whose CRC covers bit allocation that isn't parsed"""
+        return self.calc_sideinfo_size() if self.layer == LAYER_3 else None
+
     def calc_frame_size(self) -> int:
         sample_col = consts.SAMPLE_INDEX[self.layer]
         return sample_col[SAMPLE_COLUMN_MAP[self.standart]]
 
     def calc_frame_length(self) -> int:
         if self.layer == LAYER_1:
-            raw_len = 12 * self.bitrate * 1000 / self.samplerate
+            raw_len = 12 * self.bitrate * 1000 // self.samplerate
             return (raw_len + self.padding) * 4
         else:
             raw_len = self.frame_size * self.bitrate * 125 / self.samplerate
             return int(raw_len + self.padding)
 
 
+XING_TAGS = (b'Xing', b'Info')
+VBRI_TAG = b'VBRI'
+VBRI_OFFSET = 32
+
+XING_FRAMES_FLAG = 0x1
+XING_BYTES_FLAG = 0x2
+XING_TOC_FLAG = 0x4
+XING_QUALITY_FLAG = 0x8
+
+
 class FirstFrameData:
-    def __init__(self, tag, flags, frames_count, file_length):
-        self.tag = tag
+    """Xing/Info or VBRI header stored in first frame of the stream. Counts
+    are None when the encoder didn't write them"""
+
+    def __init__(self, tag, flags, frames_count, file_length, toc=None,
+                 quality=None):
+        self.tag = bytes(tag)
         self.flags = flags
-        self.frames_count = struct.unpack('>L', frames_count)[0]
-        self.file_length = struct.unpack('>L', file_length)[0]
+        self.frames_count = frames_count
+        self.file_length = file_length
+        self.toc = toc
+        self.quality = quality
 
     def print(self):
+        print("Main bytes tag:", self.tag)
         print("Main bytes flags:", self.flags)
         print("Main bytes frames count:", self.frames_count)
         print("Main bytes file length:", self.file_length)
 
 
+def parse_xing(data):
+    """data = frame bytes starting with Xing/Info tag"""
+    flags, = struct.unpack_from('>L', data, 4)
+    pos = 8
+    frames_count = file_length = toc = quality = None
+    if flags & XING_FRAMES_FLAG:
+        frames_count, = struct.unpack_from('>L', data, pos)
+        pos += 4
+    if flags & XING_BYTES_FLAG:
+        file_length, = struct.unpack_from('>L', data, pos)
+        pos += 4
+    if flags & XING_TOC_FLAG:
+        toc = bytes(data[pos:pos + 100])
+        pos += 100
+    if flags & XING_QUALITY_FLAG:
+        quality, = struct.unpack_from('>L', data, pos)
+    return FirstFrameData(bytes(data[:4]), flags, frames_count, file_length,
+                          toc, quality)
+
+
+def parse_vbri(data):
+    """data = frame bytes starting with VBRI tag"""
+    (version, delay, quality, file_length, frames_count, toc_entries,
+     toc_scale, entry_size, frames_per_entry) = \
+        struct.unpack_from('>3H2L4H', data, 4)
+    entry_format = {1: 'B', 2: 'H', 4: 'L'}.get(entry_size)
+    toc = None
+    if entry_format:
+        toc = [entry * toc_scale for entry in struct.unpack_from(
+            f'>{toc_entries}{entry_format}', data, 26)]
+    return FirstFrameData(bytes(data[:4]), version, frames_count,
+                          file_length, toc, quality)
+
+
+def parse_vbr_header(header: Header, data):
+    """data = frame bytes after 4-byte header. Returns FirstFrameData or None
+    if frame doesn't carry Xing/Info/VBRI header"""
+    try:
+        xing_pos = header.calc_sideinfo_size() + (2 if header.protection
+                                                  else 0)
+        if bytes(data[xing_pos:xing_pos + 4]) in XING_TAGS:
+            return parse_xing(data[xing_pos:])
+        if bytes(data[VBRI_OFFSET:VBRI_OFFSET + 4]) == VBRI_TAG:
+            return parse_vbri(data[VBRI_OFFSET:])
+    except struct.error:
+        pass
+    return None
+
+
 class FrameDecoder:
-    def __init__(self):
-        self.first_frame_data = None
-        self.prev_frame_main_bytes = None
+    """With decode_audio=True Layer III main data is decoded too and frames
+    carry sideinfo and granules (layer3.GranuleData [granule][channel]).
+    crc_mode other than Skip checks protected frames, sets Frame.crc_ok and
+    collects results in integrity (crc.IntegrityReport)"""
 
-    def parse_frame(self, raw_header, file):
+    def __init__(self, decode_audio=False, crc_mode=crc.CrcMode.Skip,
+                 integrity=None):
+        self.first_frame_data = None
+        self.first_frame_parsed = False
+        self.decode_audio = decode_audio
+        self.reservoir = reservoir.Reservoir() if decode_audio else None
+        self.crc_mode = crc_mode
+        self.integrity = integrity if integrity is not None \
+            else crc.IntegrityReport()
+
+    def parse_frame(self, raw_header, file, offset=None):
         header = header_from_bytes(raw_header)
-        if header.protection:  # header HAS protection!!! todo: process crc
-            print("Protection enabled!")
-
         data = file.read(header.data_length)
-        si: sideinfo.Sideinfo = self.decode_sideinfo(header, data)
-        frame_main_bytes = data[si.size:]
-        if not self.first_frame_data:
-            self.first_frame_data = \
-                self.decode_first_frame_data(frame_main_bytes)
-            self.prev_frame_main_bytes = frame_main_bytes
-        # else:
-        #     offset = si.main_data_start
-        #     self.decode_data(header, si,
-        #         self.prev_frame_main_bytes[-offset:] + frame_main_bytes)
-        #     self.prev_frame_main_bytes = frame_main_bytes
-        return Frame(header)
-
-    def decode_first_frame_data(self, first_frame_data_bytes):
-        xing_tag = len(b'Xing')
-        return FirstFrameData(
-            first_frame_data_bytes[:xing_tag],
-            first_frame_data_bytes[xing_tag:xing_tag + 4],
-            first_frame_data_bytes[xing_tag + 4:xing_tag + 8],
-            first_frame_data_bytes[xing_tag + 8:xing_tag + 12]
-        )
+        # CRC word sits between header and side info
+        crc_size = 2 if header.protection else 0
+        parsed = Frame(header, offset=offset)
+        if len(data) < crc_size + header.calc_sideinfo_size():
+            # truncated last frame
+            return parsed
+        parsed.crc_ok = self.check_crc(header, raw_header, data, offset)
+        if parsed.crc_ok is False and self.crc_mode == crc.CrcMode.Drop:
+            # following frames can't reference its main data either
+            self.discontinuity()
+            return parsed
+        si: sideinfo.Sideinfo = self.decode_sideinfo(header, data[crc_size:])
+        frame_main_bytes = data[crc_size + si.size:]
+        if not self.first_frame_parsed:
+            self.first_frame_parsed = True
+            self.first_frame_data = self.decode_first_frame_data(header, data)
+            if self.first_frame_data is not None:
+                # Xing/VBRI frame carries no audio
+                parsed.vbr_header = self.first_frame_data
+                return parsed
+        if self.decode_audio and header.layer == LAYER_3:
+            parsed.sideinfo = si
+            main_data = self.reservoir.push(si.main_data_start,
+                                            frame_main_bytes)
+            if main_data is not None:
+                parsed.granules = self.decode_data(header, si, main_data)
+        return parsed
+
+    def discontinuity(self):
+        """Called when stream doesn't continue previous frame (junk or
+        truncated frame skipped), its reservoir can't be referenced"""
+        if self.reservoir is not None:
+            self.reservoir.clear()
+
+    def skip_frame(self, raw_header, file, offset=None):
+        """Steps over frame payload, only CRC word and the bytes it covers
+        are read when CRC is checked"""
+        header = header_from_bytes(raw_header)
+        parsed = Frame(header, offset=offset)
+        if header.protection and self.crc_mode != crc.CrcMode.Skip:
+            data = file.read(2 + (header.crc_length() or 0))
+            file.skip(int(header.data_length) - len(data))
+            parsed.crc_ok = self.check_crc(header, raw_header, data, offset)
+        else:
+            file.skip(int(header.data_length))
+        return parsed
+
+    def check_crc(self, header, raw_header, data, offset=None):
+        """data = frame bytes after header. Returns True/False, None when
+        frame isn't checked"""
+        if not header.protection or self.crc_mode == crc.CrcMode.Skip:
+            return None
+        length = header.crc_length()
+        if length is None or len(data) < 2 + length:
+            ok = None
+        else:
+            ok = crc.check(raw_header, data, length)
+        self.integrity.add(offset, ok)
+        return ok
+
+    def decode_data(self, header, si, main_data):
+        """main_data = bytes from main_data_start in the reservoir. Returns
+        layer3.GranuleData list [granule][channel] of requantised lines"""
+        # imported here, header parsing doesn't need numpy
+        from . import layer3
+        return layer3.decode_main_data(header, si, main_data)
+
+    def decode_first_frame_data(self, header, data):
+        return parse_vbr_header(header, data)
 
     def decode_sideinfo(self, header, data_bytes) -> sideinfo.Sideinfo:
         return sideinfo.decode_sideinfo(header, data_bytes)
 
 
-def header_from_bytes(raw_header) -> Header:
+# Raw 4-byte header -> shared Header. CBR files repeat one or two header
+# patterns for every frame, so each pattern is decoded only once. Cache is
+# emptied when full, patterns in use come back with their next frame
+HEADER_CACHE_LIMIT = 4096
+_header_cache = {}
+
+
+def header_from_bytes(raw_header, cache=True) -> Header:
+    """cache=False for sync candidates that may turn out to be junk, they
+    are looked up but not added"""
+    raw_header = bytes(raw_header)
+    header = _header_cache.get(raw_header)
+    if header is None:
+        header = parse_header(raw_header)
+        if cache:
+            if len(_header_cache) >= HEADER_CACHE_LIMIT:
+                _header_cache.clear()
+            _header_cache[raw_header] = header
+    return header
+
+
+def cached_header(raw_header):
+    """Header of already seen frame header bytes or None"""
+    return _header_cache.get(raw_header)
+
+
+def parse_header(raw_header) -> Header:
     header = struct.unpack('>H2B', raw_header)
     sync_word = (header[0] & 0b1111_1111_1110_0000) >> 5
 
@@ -184,7 +348,7 @@ def header_from_bytes(raw_header) -> Header:
     emphasis = (header[2] & 0b0000_0011)
     return Header(standart, layer, protection, bitrate, samplerate, padding,
                   private, channel_mode, extension, copyright, is_original,
-                  emphasis)
+                  emphasis, raw=raw_header)
 
 
 def calc_bitrate(standart: int, layer_desc: int, bitrate_raw: int) -> int:
@@ -232,6 +396,13 @@ def print_layer(layer):
 
 
 class Frame:
-    def __init__(self, header: Header, data=None):
+    def __init__(self, header: Header, data=None, offset=None):
         self.header = header
         self.data = data
+        self.offset = offset
+        self.sideinfo = None
+        self.granules = None
+        # CRC check result, None when frame is unprotected or unchecked
+        self.crc_ok = None
+        # FirstFrameData of Xing/Info/VBRI frame, it carries no audio
+        self.vbr_header = None
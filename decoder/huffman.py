@@ -0,0 +1,106 @@
+from . import huffman_tables
+
+# Width of first level lookup. Longer codes continue in second level tables
+# indexed by the bits following their first LOOKUP_BITS bits
+LOOKUP_BITS = 8
+
+
+class HuffmanTable:
+    """Multi-level lookup table: every entry is (code length, value) or
+    (-next level width, next level table) for codes longer than width"""
+
+    def __init__(self, codes, lengths, values, linbits=0):
+        self.linbits = linbits
+        self.bits = min(LOOKUP_BITS, max(lengths))
+        self.lookup = build_lookup(zip(codes, lengths, values), self.bits)
+
+    def read(self, reader):
+        """Reads one codeword from bitreader.BitReader, returns its value"""
+        bits = self.bits
+        length, value = self.lookup[reader.peek(bits)]
+        while length < 0:
+            reader.skip(bits)
+            bits = -length
+            length, value = value[reader.peek(bits)]
+        reader.skip(length)
+        return value
+
+
+def build_lookup(entries, bits):
+    table = [None] * (1 << bits)
+    longer = {}
+    for code, length, value in entries:
+        if length <= bits:
+            start = code << (bits - length)
+            table[start:start + (1 << (bits - length))] = \
+                [(length, value)] * (1 << (bits - length))
+        else:
+            rest = length - bits
+            longer.setdefault(code >> rest, []).append(
+                (code & ((1 << rest) - 1), rest, value))
+    for prefix, entries in longer.items():
+        width = max(length for _, length, _ in entries)
+        table[prefix] = (-width, build_lookup(entries, width))
+    return table
+
+
+def build_big_value_tables():
+    """Returns 32 tables indexed by table_select, None for tables that carry
+    no codes (0, 4 and 14)"""
+    tables = [None] * 32
+    for number in range(32):
+        codes_number = 16 if 16 <= number < 24 else \
+            24 if number >= 24 else number
+        if codes_number not in huffman_tables.BIG_VALUE_TABLES:
+            continue
+        size, codes, lengths = huffman_tables.BIG_VALUE_TABLES[codes_number]
+        values = [(x, y) for x in range(size) for y in range(size)]
+        tables[number] = HuffmanTable(codes, lengths, values,
+                                      huffman_tables.LINBITS[number])
+    return tables
+
+
+def build_count1_table(codes, lengths):
+    values = [(v >> 3 & 1, v >> 2 & 1, v >> 1 & 1, v & 1)
+              for v in range(16)]
+    return HuffmanTable(codes, lengths, values)
+
+
+BIG_VALUE_TABLES = build_big_value_tables()
+COUNT1_TABLES = [build_count1_table(*huffman_tables.COUNT1_TABLE_A),
+                 build_count1_table(*huffman_tables.COUNT1_TABLE_B)]
+
+
+def read_big_values(reader, table: HuffmanTable, count, values):
+    """Appends count (x, y) pairs with linbits and signs applied"""
+    read = reader.read
+    table_read = table.read
+    linbits = table.linbits
+    append = values.append
+    for _ in range(count):
+        x, y = table_read(reader)
+        if linbits and x == 15:
+            x += read(linbits)
+        if x and read(1):
+            x = -x
+        if linbits and y == 15:
+            y += read(linbits)
+        if y and read(1):
+            y = -y
+        append(x)
+        append(y)
+
+
+def read_count1(reader, table: HuffmanTable, end, limit, values):
+    """Appends (v, w, x, y) quadruples with signs until reader.pos reaches
+    end bit or limit lines are decoded. Quadruple overrunning end is
+    dropped, as encoders may pad part3 with partial codewords"""
+    read = reader.read
+    while len(values) < limit and reader.pos < end:
+        quadruple = table.read(reader)
+        if reader.pos > end:
+            break
+        for value in quadruple:
+            if value and read(1):
+                value = -value
+            values.append(value)
@@ -0,0 +1,106 @@
+from array import array
+from bisect import bisect_right
+
+from . import frame
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class FrameIndex:
+    """Columnar frame storage: per-frame byte offset, length, start time and
+    header pattern id are kept in typed arrays, Frame objects are built on
+    access. Behaves like a read-only list of frames plus append().
+    Xing/Info/VBRI frame (known only for parsed, not skipped frames) stays
+    in the index with zero duration, times start at audio_start frame"""
+
+    def __init__(self):
+        self.offsets = array('Q')
+        self.lengths = array('I')
+        self.times = array('d')
+        self.header_ids = array('H')
+        self.headers = []
+        self._header_ids = {}
+        self.duration = 0.0
+        self.audio_start = 0
+
+    @classmethod
+    def from_columns(cls, headers, offsets, lengths, times, header_ids,
+                     duration, audio_start=0):
+        """Builds index from previously stored columns (see cache module)"""
+        frame_index = cls()
+        frame_index.headers = list(headers)
+        frame_index._header_ids = {header.raw: i
+                                   for i, header in enumerate(headers)}
+        frame_index.offsets = offsets
+        frame_index.lengths = lengths
+        frame_index.times = times
+        frame_index.header_ids = header_ids
+        frame_index.duration = duration
+        frame_index.audio_start = audio_start
+        return frame_index
+
+    @property
+    def audio_count(self):
+        """Number of frames carrying audio"""
+        return len(self.offsets) - self.audio_start
+
+    def append(self, framedata: frame.Frame):
+        self.add(framedata.offset or 0, framedata.header,
+                 audio=framedata.vbr_header is None)
+
+    def add(self, offset, header: frame.Header, length=None, audio=True):
+        header_id = self._header_ids.get(header.raw)
+        if header_id is None:
+            header_id = len(self.headers)
+            self.headers.append(header)
+            self._header_ids[header.raw] = header_id
+        self.offsets.append(offset)
+        self.lengths.append(int(header.frame_length if length is None
+                                else length))
+        self.header_ids.append(header_id)
+        self.times.append(self.duration)
+        if audio:
+            self.duration += header.frame_size / header.samplerate
+        elif len(self.offsets) == 1:
+            self.audio_start = 1
+
+    def header(self, i) -> frame.Header:
+        return self.headers[self.header_ids[i]]
+
+    def frame_at(self, seconds) -> int:
+        """Number of frame playing at given time, O(log n)"""
+        if not self.offsets:
+            raise IndexError('Frame index is empty')
+        first = min(self.audio_start, len(self.offsets) - 1)
+        return max(first, bisect_right(self.times, seconds) - 1)
+
+    def seek(self, seconds):
+        """Returns (frame number, byte offset) of frame playing at given
+        time"""
+        i = self.frame_at(seconds)
+        return i, self.offsets[i]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return frame.Frame(self.header(i), offset=self.offsets[i])
+
+    def __iter__(self):
+        headers = self.headers
+        for offset, header_id in zip(self.offsets, self.header_ids):
+            yield frame.Frame(headers[header_id], offset=offset)
+
+    def as_numpy(self):
+        """Returns (offsets, lengths, header_ids) as numpy arrays sharing
+        memory with the index. The index can't grow while they are alive"""
+        if numpy is None:
+            raise BaseException('numpy is not installed')
+        return (numpy.frombuffer(self.offsets, dtype=numpy.uint64),
+                numpy.frombuffer(self.lengths, dtype=numpy.uint32),
+                numpy.frombuffer(self.header_ids, dtype=numpy.uint16))
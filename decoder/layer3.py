@@ -0,0 +1,251 @@
+import functools
+
+import numpy
+
+from . import bitreader, consts, huffman
+
+LINES = 576
+
+# |is| ** (4/3) for every magnitude Huffman decoding can produce
+# (15 + 13 linbits)
+POW43 = numpy.arange(15 + (1 << 13), dtype=numpy.float64) ** (4 / 3)
+
+
+class BandLayout:
+    """Scalefactor slots of one block kind: long bands followed by short
+    bands window by window, in the order scalefactors are coded. slot and
+    window map each of 576 frequency lines to its slot and short window
+    (-1 for long bands)"""
+
+    def __init__(self, samplerate, short, mixed, lsf):
+        long_sfb, short_sfb = consts.SCALE_FACTOR_INDICES[samplerate]
+        if not short:
+            long_bands, short_from = 22, 13
+        elif mixed:
+            long_bands, short_from = 6 if lsf else 8, 3
+        else:
+            long_bands, short_from = 0, 0
+        self.short = short
+        self.long_bands = long_bands
+        self.short_from = short_from
+
+        slot = numpy.zeros(LINES, dtype=numpy.intp)
+        window = numpy.full(LINES, -1, dtype=numpy.intp)
+        for band in range(long_bands):
+            slot[long_sfb[band]:long_sfb[band + 1]] = band
+        slots = long_bands
+        for band in range(short_from, 13):
+            width = short_sfb[band + 1] - short_sfb[band]
+            start = 3 * short_sfb[band]
+            for win in range(3):
+                lines = slice(start + win * width, start + (win + 1) * width)
+                slot[lines] = slots
+                window[lines] = win
+                slots += 1
+        self.slots = slots
+        self.slot = slot
+        self.window = window
+        self.pretab = numpy.zeros(slots)
+        self.pretab[:long_bands] = consts.PRETAB[:long_bands]
+
+
+@functools.lru_cache(maxsize=None)
+def band_layout(samplerate, short, mixed, lsf) -> BandLayout:
+    return BandLayout(samplerate, short, mixed, lsf)
+
+
+class GranuleData:
+    """Main data of one granule and channel. scalefac holds one value per
+    layout slot, scalefac_bits their slen (intensity stereo limits), xr the
+    576 requantised frequency lines and nonzero the count of lines before
+    the all-zero region"""
+
+    def __init__(self, layout: BandLayout):
+        self.layout = layout
+        self.scalefac = [0] * layout.slots
+        self.scalefac_bits = [0] * layout.slots
+        self.preflag = 0
+        self.xr = numpy.zeros(LINES)
+        self.nonzero = 0
+
+
+def decode_main_data(header, si, data):
+    """data = main data of the frame, starting at main_data_start byte of
+    the reservoir. Returns GranuleData list [granule][channel]. Granules
+    are decoded as far as data allows, the rest stays silent"""
+    lsf = header.standart != consts.Standards.MPEG_1
+    channels = header.channels_count()
+    bits = len(data) * 8
+    value = int.from_bytes(data, 'big')
+
+    granules = []
+    pos = 0
+    for gr in range(si.granules):
+        channels_data = []
+        for ch in range(channels):
+            short = si.win_switch_flag[gr][ch] == 1 \
+                and si.block_type[gr][ch] == consts.WindowType.Short
+            mixed = short and si.mixed_block_flag[gr][ch] == 1
+            granule = GranuleData(
+                band_layout(header.samplerate, short, mixed, lsf))
+            length = si.part_23_length[gr][ch]
+            if pos + length <= bits:
+                # granule's part2_3 bits only, so reads shift short ints
+                part = value >> (bits - pos - length) & ((1 << length) - 1)
+                reader = bitreader.BitReader(part, length)
+                previous = granules[0][ch] if gr else None
+                try:
+                    decode_granule(header, si, gr, ch, reader, granule,
+                                   previous)
+                except EOFError:
+                    pass
+            pos += length
+            channels_data.append(granule)
+        granules.append(channels_data)
+    return granules
+
+
+def decode_granule(header, si, gr, ch, reader, granule: GranuleData,
+                   previous: GranuleData = None):
+    if header.standart == consts.Standards.MPEG_1:
+        read_scalefactors(reader, granule, *mpeg1_partitions(si, gr, ch),
+                          previous)
+        granule.preflag = si.preflag[gr][ch]
+    else:
+        partitions, granule.preflag = lsf_partitions(
+            si.scalefac_compress[gr][ch], granule.layout,
+            ch == 1 and header.use_intensity_stereo())
+        read_scalefactors(reader, granule, partitions)
+
+    values = read_huffman(reader, si, gr, ch, header.samplerate)
+    granule.nonzero = len(values)
+    requantize(si, gr, ch, granule, values)
+
+
+def mpeg1_partitions(si, gr, ch):
+    """Returns ([(scalefactors count, slen), ...], scfsi flags per
+    partition). scfsi only applies to long blocks of second granule"""
+    slen1, slen2 = consts.SCALEFAC_SIZES[si.scalefac_compress[gr][ch]]
+    short = si.win_switch_flag[gr][ch] == 1 \
+        and si.block_type[gr][ch] == consts.WindowType.Short
+    if short:
+        count1 = 17 if si.mixed_block_flag[gr][ch] else 18
+        return [(count1, slen1), (18, slen2)], None
+    partitions = [(end - start, slen1 if i < 2 else slen2)
+                  for i, (start, end) in enumerate(consts.SCFSI_BANDS)]
+    return partitions, si.scale_factor_selection[ch] if gr else None
+
+
+def lsf_partitions(scalefac_compress, layout: BandLayout, intensity):
+    """MPEG 2/2.5 scalefactor partitions and preflag. Right channel of
+    intensity stereo frame codes its sizes differently"""
+    preflag = 0
+    if intensity:
+        compress = scalefac_compress >> 1
+        if compress < 180:
+            table = 3
+            slen = (compress // 36, compress % 36 // 6, compress % 6, 0)
+        elif compress < 244:
+            table = 4
+            compress -= 180
+            slen = (compress >> 4 & 3, compress >> 2 & 3, compress & 3, 0)
+        else:
+            table = 5
+            compress -= 244
+            slen = (compress // 3, compress % 3, 0, 0)
+    elif scalefac_compress < 400:
+        table = 0
+        slen = (scalefac_compress >> 4) // 5, (scalefac_compress >> 4) % 5, \
+            (scalefac_compress & 15) >> 2, scalefac_compress & 3
+    elif scalefac_compress < 500:
+        table = 1
+        compress = scalefac_compress - 400
+        slen = ((compress >> 2) // 5, (compress >> 2) % 5, compress & 3, 0)
+    else:
+        table = 2
+        preflag = 1
+        compress = scalefac_compress - 500
+        slen = (compress // 3, compress % 3, 0, 0)
+
+    block = 0 if not layout.short else 2 if layout.long_bands else 1
+    counts = consts.LSF_PARTITIONS[table][block]
+    return list(zip(counts, slen)), preflag
+
+
+def read_scalefactors(reader, granule: GranuleData, partitions, scfsi=None,
+                      previous: GranuleData = None):
+    read = reader.read
+    pos = 0
+    for i, (count, slen) in enumerate(partitions):
+        end = pos + count
+        if scfsi and scfsi[i] and previous is not None:
+            granule.scalefac[pos:end] = previous.scalefac[pos:end]
+        elif slen:
+            granule.scalefac[pos:end] = [read(slen) for _ in range(count)]
+        granule.scalefac_bits[pos:end] = [slen] * count
+        pos = end
+
+
+def read_huffman(reader, si, gr, ch, samplerate):
+    """Returns quantised values of big_values and count1 regions"""
+    long_sfb, short_sfb = consts.SCALE_FACTOR_INDICES[samplerate]
+    big_values = min(si.big_values[gr][ch] * 2, LINES)
+    if si.block_type[gr][ch] == consts.WindowType.Short \
+            and si.win_switch_flag[gr][ch] == 1:
+        region2_start = LINES
+        region1_start = 36 if si.mixed_block_flag[gr][ch] \
+            else 3 * short_sfb[3]
+    elif si.win_switch_flag[gr][ch] == 1:
+        region1_start = long_sfb[si.region0_count[gr][ch] + 1]
+        region2_start = LINES
+    else:
+        region0 = si.region0_count[gr][ch] + 1
+        region1 = region0 + si.region1_count[gr][ch] + 1
+        region1_start = long_sfb[min(region0, 22)]
+        region2_start = long_sfb[min(region1, 22)]
+
+    values = []
+    start = 0
+    table_select = si.table_select[gr][ch]
+    for region, end in enumerate((region1_start, region2_start, LINES)):
+        end = min(end, big_values)
+        if end <= start:
+            continue
+        table = huffman.BIG_VALUE_TABLES[table_select[region]]
+        if table is None:
+            values.extend([0] * (end - start))
+        else:
+            huffman.read_big_values(reader, table, (end - start) // 2,
+                                    values)
+        start = end
+
+    table = huffman.COUNT1_TABLES[si.count1_table_select[gr][ch]]
+    huffman.read_count1(reader, table, reader.bits, LINES, values)
+    del values[LINES:]
+    return values
+
+
+def requantize(si, gr, ch, granule: GranuleData, values):
+    """xr = sign(is) * |is|^(4/3) * 2^(gain/4), gain combines global gain,
+    subblock gain and scalefactors of the line's slot"""
+    count = len(values)
+    if not count:
+        return
+    layout = granule.layout
+    quantized = numpy.array(values, dtype=numpy.intp)
+
+    shift = 1 + si.scalefac_scale[gr][ch]
+    scalefac = numpy.array(granule.scalefac, dtype=numpy.float64)
+    if granule.preflag:
+        scalefac += layout.pretab
+    # gain in quarter steps: scalefactors are 2^-(0.5 * shift * sf)
+    slot_gain = -2 * shift * scalefac
+    gain = si.global_gain[gr][ch] - 210 + slot_gain[layout.slot[:count]]
+    if layout.short:
+        subblock_gain = numpy.array(
+            [0] + [8 * g for g in si.subblock_gain[gr][ch]], dtype=float)
+        gain -= subblock_gain[layout.window[:count] + 1]
+
+    magnitude = POW43[numpy.minimum(numpy.abs(quantized), len(POW43) - 1)]
+    granule.xr[:count] = numpy.copysign(magnitude, quantized) \
+        * numpy.exp2(gain / 4)
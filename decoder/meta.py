@@ -1,8 +1,11 @@
 import struct
-import bitstring
+import zlib
 
 ID3V1_MAGIC = b'TAG'
 ID3V2_MAGIC = b'ID3'
+# Pending frames up to this size are copied when tag is detached from
+# mapped file, longer ones are read again on access
+DETACH_COPY_LIMIT = 1024
 
 
 def decode_synchsafe(safe_size):
@@ -46,6 +49,7 @@ class MetaID3V1:
         self.year = year
         self.comment = comment.decode('ISO-8859-1').strip('\u0000')
         self.genre = GENRES[genre] if genre < len(GENRES) else "Unknown"
+        self.offset = None
 
     def print(self):
         print("MetaID3V1 Tag")
@@ -65,33 +69,113 @@ def parse_id3v1(header, stream):
     return metadata
 
 
+class FileRange:
+    """Frame body left in source file. The file must not change before the
+    frame is accessed"""
+
+    def __init__(self, path, offset, length):
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def read(self):
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset)
+            return file.read(self.length)
+
+
+def tag_field(name):
+    """Property for MetaID3V2 field. Frames appended in lazy mode are kept
+    as (id, flags, data view) and decoded on first access"""
+
+    def getter(self):
+        pending = self._pending.pop(name, None)
+        if pending is not None:
+            tag, flags, data, _ = pending
+            if isinstance(data, FileRange):
+                data = data.read()
+            self.decode_frame(tag, flags, data)
+        return self._values.get(name)
+
+    def setter(self, value):
+        self._pending.pop(name, None)
+        self._values[name] = value
+
+    return property(getter, setter)
+
+
 class MetaID3V2:
-    def __init__(self, version, flags):
+    def __init__(self, version, flags, lazy=False):
         self.version = version
         self.unsync = bool(flags & 0b1000_0000)
         self.extended_header = bool(flags & 0b0100_0000)
         self.experimental = bool(flags & 0b0010_0000)
-
-        self.title = None
-        self.compositor = None
-        self.performer_1 = None
-        self.year = None
-        self.album = None
-        self.track = None
-        self.album_image_bytes: bytes = None
-        self.encoder = None
-        self.copyright = None
-
-    def append_frame(self, tag, flags, data):
+        self.flags = flags
+        self.offset = None
+        self.lazy = lazy
+
+        self._values = {}
+        self._pending = {}
+
+    title = tag_field('title')
+    compositor = tag_field('compositor')
+    performer_1 = tag_field('performer_1')
+    year = tag_field('year')
+    album = tag_field('album')
+    track = tag_field('track')
+    album_image_bytes = tag_field('album_image_bytes')
+    encoder = tag_field('encoder')
+    copyright = tag_field('copyright')
+    comment = tag_field('comment')
+    lyrics = tag_field('lyrics')
+
+    def append_frame(self, tag, flags, data, offset=None):
+        """offset = position of data in source file, if known"""
         if tag in frame_parsers:
+            if self.lazy:
+                self._pending[frame_fields[tag]] = (tag, flags, data, offset)
+            else:
+                self.decode_frame(tag, flags, data)
+
+    def detach(self, path=None, wanted=None):
+        """Moves pending frames off the source buffer, so mapped file can be
+        closed. Frames asked for with wanted and short ones are copied,
+        longer ones (covers) are left in file at path and read on access"""
+        # snapshot, fields may be decoded (popped) on another thread
+        for name, pending in list(self._pending.items()):
+            tag, flags, data, offset = pending
+            if not isinstance(data, memoryview):
+                continue
+            if path is None or offset is None or wanted is not None \
+                    or len(data) <= DETACH_COPY_LIMIT:
+                data = bytes(data)
+            else:
+                data = FileRange(path, offset, len(data))
+            if self._pending.get(name) is pending:
+                self._pending[name] = (tag, flags, data, offset)
+
+    def decode_frame(self, tag, flags, data):
+        data = frame_content(self, flags, data)
+        if data is not None:
             frame_parsers[tag](self, flags, data)
 
+    def __getstate__(self):
+        # pending frames hold views into the source buffer, which can't be
+        # pickled (e.g. when sent back from executor processes)
+        for name in list(self._pending):
+            getattr(self, name)
+        return self.__dict__
+
+    def has_album_image(self):
+        return 'album_image_bytes' in self._pending \
+            or self._values.get('album_image_bytes') is not None
+
     def is_version_supported(self):
         return self.version == 0x0300 or self.version == 0x0400
 
     def print(self):
         print("MetaID3V2 version:", self.version)
-        print("MetaID3V2 has album image:", self.album_image_bytes is None)
+        print("MetaID3V2 has album image:", self.has_album_image())
         print("MetaID3V2 extended header:", self.extended_header)
         print("MetaID3V2 unsynchronization:", self.unsync)
         print("MetaID3V2 experimental:", self.experimental)
@@ -101,43 +185,98 @@ ENCODINGS = [
     ('ISO-8859-1', 1), ('UTF-16', 2), ('UTF-16BE', 2), ('UTF-8', 1)
 ]
 
+# Frame format flags (second flags byte)
+V23_COMPRESSED = 0x80
+V23_ENCRYPTED = 0x40
+V23_GROUPED = 0x20
+V24_GROUPED = 0x40
+V24_COMPRESSED = 0x08
+V24_ENCRYPTED = 0x04
+V24_UNSYNC = 0x02
+V24_DATA_LENGTH = 0x01
+
+# Terminators are searched in chunks, so long frames held as memoryview
+# aren't copied just to find the end of a short string
+TERMINATOR_CHUNK = 4096
+
+
+def remove_unsync(data):
+    """Undoes unsynchronisation: every 0xff 0x00 pair becomes 0xff"""
+    return bytes(data).replace(b'\xff\x00', b'\xff')
+
+
+def frame_content(meta: MetaID3V2, flags, data):
+    """Returns frame data without fields added by format flags, with
+    unsynchronisation and compression undone. None for encrypted frames"""
+    format_flags = flags[1]
+    if meta.version == 0x0400:
+        if format_flags & V24_ENCRYPTED:
+            return None
+        compressed = format_flags & V24_COMPRESSED
+        data = data[bool(format_flags & V24_GROUPED)
+                    + 4 * bool(format_flags & V24_DATA_LENGTH):]
+        if meta.unsync or format_flags & V24_UNSYNC:
+            data = remove_unsync(data)
+    else:
+        if format_flags & V23_ENCRYPTED:
+            return None
+        compressed = format_flags & V23_COMPRESSED
+        data = data[4 * bool(compressed)
+                    + bool(format_flags & V23_GROUPED):]
+    if compressed:
+        data = zlib.decompress(data)
+    return data
+
+
+def find_terminator(data, start, width):
+    """Returns position of first null character at or after start, aligned
+    to character width, or len(data) when string isn't terminated"""
+    terminator = bytes(width)
+    pos = start
+    while pos < len(data):
+        chunk = bytes(data[pos:pos + TERMINATOR_CHUNK])
+        found = chunk.find(terminator)
+        while found >= 0 and found % width:
+            found = chunk.find(terminator, found + 1)
+        if found >= 0:
+            return pos + found
+        pos += len(chunk)
+    return len(data)
+
+
+def read_text(data, pos, encoding):
+    """Returns (string at pos, position after its terminator)"""
+    name, width = ENCODINGS[encoding]
+    end = find_terminator(data, pos, width)
+    return str(data[pos:end], name), end + width
+
 
 def parse_apic(meta: MetaID3V2, flags, data):
-    stream = bitstring.BitStream(data)
-    encoding = ENCODINGS[stream.read('int:8')]
-
-    mime = b""
-    while True:
-        tmp = stream.read('bytes:1')
-        if tmp != b"\x00":
-            mime += tmp
-        else:
-            break
+    mime_end = find_terminator(data, 1, 1)
+    pic_type = data[mime_end + 1]
+    description, pos = read_text(data, mime_end + 2, data[0])
 
-    pic_type = stream.read('bytes:1')
+    meta.album_image_bytes = bytes(data[pos:])
 
-    description = b''
-    while True:
-        tmp = stream.read('bytes:' + str(encoding[1]))
-        if tmp != b'\x00' * encoding[1]:
-            description += tmp
-        else:
-            break
 
-    meta.album_image_bytes = data[stream.bytepos:]
+def parse_text_frame(data):
+    if not data:
+        return ''
+    return read_text(data, 1, data[0])[0]
 
 
-def parse_text_frame(data):
-    stream = bitstring.BitStream(data)
-    encoding = ENCODINGS[stream.read('int:8')]
-    data = b''
-    while stream.bytepos < stream.len // 8:
-        tmp = stream.read('bytes:' + str(encoding[1]))
-        if tmp != b'\x00' * encoding[1]:
-            data += tmp
-        else:
-            break
-    return data.decode(encoding[0])
+def parse_language_text(data):
+    """COMM and USLT: encoding, language, description, text"""
+    description, pos = read_text(data, 4, data[0])
+    return read_text(data, pos, data[0])[0]
+
+
+def parse_comm(meta: MetaID3V2, flags, data):
+    meta.comment = parse_language_text(data)
+
+
+def parse_uslt(meta: MetaID3V2, flags, data):
+    meta.lyrics = parse_language_text(data)
 
 
 def parse_tcom(meta: MetaID3V2, flags, data):
@@ -183,43 +322,127 @@ frame_parsers = {
     "TSSE": parse_tsse,
     "TRCK": parse_trck,
     "TCOP": parse_tcop,
+    "COMM": parse_comm,
+    "USLT": parse_uslt,
 }
 
+frame_fields = {
+    "APIC": 'album_image_bytes',
+    "TCOM": 'compositor',
+    "TALB": 'album',
+    "TIT2": 'title',
+    "TPE1": 'performer_1',
+    "TYER": 'year',
+    "TDRC": 'year',
+    "TSSE": 'encoder',
+    "TRCK": 'track',
+    "TCOP": 'copyright',
+    "COMM": 'comment',
+    "USLT": 'lyrics',
+}
 
-def parse_id3v2(header, stream):
-    """header = 4 first bytes!!!"""
-    header = header + stream.read(6)
+ID3V2_HEADER_SIZE = 10
+ID3V2_FRAME_HEADER = struct.Struct('>4sI2s')
+
+
+def parse_id3v2(header, stream, lazy=True, wanted=None):
+    """header = 4 first bytes!!!
+    lazy: frames are only tokenised, fields are decoded on access
+    wanted: set of frame ids to keep (e.g. {'TIT2', 'TPE1'}), other frames
+    are not even sliced. Seekable streams skip unwanted frame bodies
+    without reading them"""
+    header = bytes(header) + bytes(stream.read(6))
     tag = header[0:3]
     version, flags, safe_size = struct.unpack('>HBI', header[3:])
 
-    meta = MetaID3V2(version, flags)
+    meta = MetaID3V2(version, flags, lazy)
 
     size = decode_synchsafe(safe_size)
 
-    data = stream.read(size)
-    # print(data)
     if not meta.is_version_supported():
+        if hasattr(stream, 'skip'):
+            stream.skip(size)
+        else:
+            stream.read(size)
         return meta
 
-    parse_id3v2_frames(data, meta, size, version)
+    # ID3v2.3 unsynchronises whole tag including frame headers, ID3v2.4
+    # does it per frame and is handled when frames are decoded
+    whole_unsync = meta.unsync and version == 0x0300
+    if wanted is not None and hasattr(stream, 'skip') and not whole_unsync:
+        if meta.extended_header:
+            length = min(extended_header_length(version, stream.read(4)),
+                         size)
+            stream.skip(length - 4)
+            size -= length
+        read_id3v2_frames(stream, meta, size, version, wanted)
+    else:
+        # file offset of data, unknown once unsynchronisation is undone
+        base = stream.tell() if hasattr(stream, 'tell') else None
+        data = stream.read(size)
+        if whole_unsync:
+            data = remove_unsync(data)
+            base = None
+        if meta.extended_header:
+            length = extended_header_length(version, data[:4])
+            data = data[length:]
+            base = None if base is None else base + length
+        parse_id3v2_frames(data, meta, len(data), version, wanted, base)
 
     return meta
 
 
-def parse_id3v2_frames(data, meta, size, version):
-    frame_stream = bitstring.BitStream(data)
-    while frame_stream.bytepos <= size - 4:
-        frame_id = frame_stream.read('bytes:4')
+def extended_header_length(version, raw_size):
+    """raw_size = first 4 bytes of extended header. Returns its length
+    including the size field"""
+    extended_size, = struct.unpack('>I', bytes(raw_size))
+    if version == 0x0400:
+        return decode_synchsafe(extended_size)
+    return extended_size + 4
+
+
+def parse_id3v2_frames(data, meta, size, version, wanted=None, base=None):
+    """base = file offset of data, None if unknown"""
+    pos = 0
+    while pos <= size - ID3V2_FRAME_HEADER.size:
+        frame_id, frame_size, frame_flags = \
+            ID3V2_FRAME_HEADER.unpack_from(data, pos)
         if frame_id == b'\x00\x00\x00\x00':
             break
-        frame_id = frame_id.decode()
-        frame_size = frame_stream.read('uint:32')
+        frame_id = frame_id.decode('latin-1')
         if version == 0x0400:
             frame_size = decode_synchsafe(frame_size)
+        pos += ID3V2_FRAME_HEADER.size
+
+        if wanted is None or frame_id in wanted:
+            meta.append_frame(frame_id, frame_flags,
+                              data[pos:pos + frame_size],
+                              None if base is None else base + pos)
+        pos += frame_size
+
+
+def read_id3v2_frames(stream, meta, size, version, wanted):
+    """Reads frame headers one by one, skips bodies of unwanted frames"""
+    pos = 0
+    while pos <= size - ID3V2_FRAME_HEADER.size:
+        frame_header = bytes(stream.read(ID3V2_FRAME_HEADER.size))
+        pos += len(frame_header)
+        if len(frame_header) < ID3V2_FRAME_HEADER.size:
+            return
+        frame_id, frame_size, frame_flags = \
+            ID3V2_FRAME_HEADER.unpack(frame_header)
+        if frame_id == b'\x00\x00\x00\x00':
+            break
+        frame_id = frame_id.decode('latin-1')
+        if version == 0x0400:
+            frame_size = decode_synchsafe(frame_size)
+        frame_size = min(frame_size, size - pos)
 
-        frame_flags = frame_stream.read('bytes:2')
-        frame_data = frame_stream.read('bytes:' + str(frame_size))
-
-        print(frame_id)
-
-        meta.append_frame(frame_id, frame_flags, frame_data)
+        if frame_id in wanted:
+            offset = stream.tell()
+            meta.append_frame(frame_id, frame_flags,
+                              stream.read(frame_size), offset)
+        else:
+            stream.skip(frame_size)
+        pos += frame_size
+    stream.skip(size - pos)
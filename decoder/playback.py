@@ -0,0 +1,86 @@
+import queue
+import threading
+
+import numpy
+
+from . import synthesis
+
+# Frames per PCM chunk (about 100 ms of MPEG 1 audio) and count of chunks
+# decoded ahead of playback
+CHUNK_FRAMES = 4
+AHEAD = 20
+
+
+class DecodeAhead:
+    """Decodes Layer III audio of path from byte offset on producer thread
+    into bounded queue of (samples, channels) int16 chunks, so memory stays
+    at `ahead` chunks whatever the track length. First chunk is decoded
+    before constructor returns: samplerate and channels are known and
+    playback can start at once (both are None for files without Layer III
+    audio)"""
+
+    def __init__(self, path, offset=0, chunk_frames=CHUNK_FRAMES,
+                 ahead=AHEAD):
+        self.chunks = queue.Queue(maxsize=ahead)
+        self.stopped = threading.Event()
+        self.error = None
+        self.samplerate = None
+        self.channels = None
+
+        self.file = open(path, 'rb')
+        self.file.seek(offset)
+        self.blocks = synthesis.iter_blocks(self.file, numpy.int16,
+                                            chunk_frames)
+        first = next(self.blocks, None)
+        if first is not None:
+            header, pcm = first
+            self.samplerate = header.samplerate
+            self.channels = pcm.shape[1]
+            self.chunks.put(pcm)
+        self.thread = threading.Thread(target=self.produce, daemon=True)
+        self.thread.start()
+
+    def produce(self):
+        try:
+            for _, pcm in self.blocks:
+                self.chunks.put(fit_channels(pcm, self.channels))
+                if self.stopped.is_set():
+                    return
+        except Exception as e:
+            self.error = e
+        finally:
+            self.blocks.close()
+            self.file.close()
+        # end of stream
+        self.chunks.put(None)
+
+    def get(self, timeout=None):
+        """Returns next PCM chunk, None at the end of stream. Raises
+        queue.Empty after timeout when producer lags behind"""
+        return self.chunks.get(timeout=timeout)
+
+    def close(self):
+        """Stops producer thread, blocked put() is released by draining
+        the queue"""
+        self.stopped.set()
+        while True:
+            try:
+                self.chunks.get_nowait()
+            except queue.Empty:
+                break
+
+
+def fit_channels(pcm, channels):
+    """Mono/stereo changes mid-stream are mixed to the output channels"""
+    if pcm.shape[1] == channels:
+        return pcm
+    if channels == 1:
+        return pcm.mean(axis=1, keepdims=True).astype(pcm.dtype)
+    return numpy.repeat(pcm, channels, axis=1)
+
+
+def scale(pcm, volume):
+    """Volume 0.0 - 1.0 applied to int16 chunk in place"""
+    if volume < 1:
+        numpy.multiply(pcm, volume, out=pcm, casting='unsafe')
+    return pcm
@@ -0,0 +1,170 @@
+import io
+import mmap
+
+from . import sync
+
+SYNC_WINDOW = 1 << 16
+
+
+class MemoryReader:
+    """File-like reader over a buffer, read() returns memoryview slices.
+    mapped = mmap owned by reader, unmapped by close()"""
+
+    def __init__(self, buffer, pos=0, mapped=None):
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.pos = pos
+        self.mapped = mapped
+
+    def close(self):
+        """Slices handed out must not be used afterwards. Mapping still
+        exported by slices someone keeps is left to garbage collector"""
+        self.view.release()
+        if self.mapped is not None:
+            try:
+                self.mapped.close()
+            except BufferError:
+                pass
+
+    def read(self, size=-1):
+        start = self.pos
+        if size is None or size < 0:
+            end = len(self.view)
+        else:
+            end = min(start + size, len(self.view))
+        self.pos = end
+        return self.view[start:end]
+
+    def tell(self):
+        return self.pos
+
+    def skip(self, size):
+        self.pos = min(self.pos + size, len(self.view))
+
+    def unread(self, data):
+        self.pos -= len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        self.pos = max(0, min(offset, len(self.view)))
+        return self.pos
+
+    def __len__(self):
+        return len(self.view)
+
+    def find_truncation(self, offset, length):
+        """Returns position of confirmed frame or tag starting inside frame
+        [offset, offset + length) when nothing plausible follows the frame,
+        i.e. the frame was cut short, otherwise -1"""
+        end = offset + length
+        if end <= len(self.view) < end + 4:
+            return -1
+        if end < len(self.view) \
+                and sync.is_item_start(bytes(self.view[end:end + 4])):
+            return -1
+        if not hasattr(self.buffer, 'find'):
+            self.buffer = bytes(self.view)
+        return sync.find_sync(self.buffer, offset + 1,
+                              min(end, len(self.view)))
+
+    def resync(self):
+        """Moves to next confirmed frame or tag, returns skipped bytes count"""
+        if not hasattr(self.buffer, 'find'):
+            self.buffer = bytes(self.view)
+        start = self.pos
+        pos = sync.find_sync(self.buffer, start)
+        self.pos = len(self.view) if pos < 0 else pos
+        return self.pos - start
+
+
+class StreamReader:
+    """Wraps sequential file object and keeps track of read position, so
+    frame offsets are known for pipes and sockets too. Bytes looked at
+    while resyncing are kept in pending buffer and served before file"""
+
+    def __init__(self, file):
+        self.file = file
+        self.pending = b''
+        try:
+            self.pos = file.tell()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            self.pos = 0
+
+    def read(self, size=-1):
+        if self.pending:
+            if size is None or size < 0:
+                data = self.pending + self.file.read()
+                self.pending = b''
+            else:
+                data = self.pending[:size]
+                self.pending = self.pending[size:]
+                if len(data) < size:
+                    data += self.file.read(size - len(data))
+        else:
+            data = self.file.read(size)
+        self.pos += len(data)
+        return data
+
+    def unread(self, data):
+        self.pending = bytes(data) + self.pending
+        self.pos -= len(data)
+
+    def find_truncation(self, offset, length):
+        """Truncated frames can't be detected without looking ahead"""
+        return -1
+
+    def tell(self):
+        return self.pos
+
+    def skip(self, size):
+        if self.pending:
+            skipped = len(self.read(min(size, len(self.pending))))
+            size -= skipped
+        try:
+            seekable = self.file.seekable()
+        except AttributeError:
+            seekable = False
+        if seekable:
+            self.file.seek(size, io.SEEK_CUR)
+            self.pos += size
+        else:
+            while size > 0:
+                data = self.read(min(size, 1 << 16))
+                if not data:
+                    break
+                size -= len(data)
+
+    def resync(self):
+        """Moves to next confirmed frame or tag, returns skipped bytes count.
+        Reads file in windows, candidates near the window end are checked
+        once enough bytes follow them"""
+        skipped = 0
+        window = b''
+        while True:
+            chunk = self.read(SYNC_WINDOW)
+            window += chunk
+            end = len(window) if not chunk \
+                else max(0, len(window) - sync.LOOKAHEAD)
+            pos = sync.find_sync(window, 0, end)
+            if pos >= 0:
+                self.unread(window[pos:])
+                return skipped + pos
+            if not chunk:
+                return skipped + len(window)
+            skipped += end
+            window = window[end:]
+
+
+def map_file(file):
+    """Returns MemoryReader over mmap of file or None if file can't be mapped
+    (pipes, sockets, in-memory streams, empty files)"""
+    try:
+        fileno = file.fileno()
+        pos = file.tell()
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return None
+    return MemoryReader(mapped, pos, mapped)
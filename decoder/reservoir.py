@@ -0,0 +1,47 @@
+# Longest main_data_start back pointer (MPEG 1, 9 bits)
+MAX_BACK = 511
+
+# Longest main data of one frame is below 1441 bytes (MPEG 1 Layer III
+# 320 kbps at 32 kHz with padding), several fit before buffer wraps
+BUFFER_SIZE = 4096
+
+
+class Reservoir:
+    """Bit reservoir over fixed-size buffer. Main data of every frame is
+    copied in once, right after the bytes of previous frames, so main data
+    of a frame is one contiguous memoryview slice. When buffer end is
+    reached, only the last MAX_BACK bytes are moved back to its start"""
+
+    def __init__(self, size=BUFFER_SIZE):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.end = 0
+        # bytes before end that next frame may reference
+        self.available = 0
+
+    def clear(self):
+        """Forgets previous frames, e.g. after skipping junk"""
+        self.available = 0
+
+    def push(self, main_data_start, data):
+        """data = main data bytes of the frame. Appends them and returns
+        view of the frame's main data starting main_data_start bytes back,
+        or None when reservoir doesn't hold that many bytes (stream start,
+        after junk or corrupt pointer)"""
+        size = len(data)
+        if self.end + size > len(self.buffer):
+            keep = self.available
+            self.view[:keep] = self.view[self.end - keep:self.end]
+            self.end = self.available = keep
+            if size > len(self.buffer) - keep:
+                # can't happen for valid headers, keep the tail only
+                data = data[size - (len(self.buffer) - keep):]
+                size = len(data)
+        start = self.end - main_data_start
+        self.view[self.end:self.end + size] = data
+        self.end += size
+        underflow = main_data_start > self.available
+        self.available = min(self.available + size, MAX_BACK)
+        if underflow:
+            return None
+        return self.view[start:self.end]
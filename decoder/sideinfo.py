@@ -1,10 +1,10 @@
-import bitstring
-from . import consts
+from . import bitreader, consts
 
 
 class Sideinfo:
     def __init__(self, size):
         self.size = size
+        self.granules = 2
         self.main_data_start = 0
         self.priv_bits = ''
         self.scale_factor_selection = [[0, 0, 0, 0], [0, 0, 0, 0]]
@@ -30,58 +30,67 @@ class Sideinfo:
 
 def decode_sideinfo(header, data_bytes):
     sideinfo_size = header.calc_sideinfo_size()
-    sideinfo_bytes = data_bytes[:sideinfo_size]
-    # print("Sideinfo:", sideinfo_bytes)
-
     sideinfo = Sideinfo(sideinfo_size)
+    read_bits = bitreader.BitReader(data_bytes[:sideinfo_size]).read
 
-    buf = bitstring.BitStream(bytes=sideinfo_bytes)
-
-    def read_bits(count: int):
-        return buf.read('uint:' + str(count))
+    channels = header.channels_count()
+    mono = header.channel_mode == consts.ChannelMode.Mono
 
-    sideinfo.main_data_start = read_bits(9)
-    # print("Sideinfo main data start:", sideinfo.main_data_start)
-
-    if header.channel_mode == consts.ChannelMode.Mono:
-        sideinfo.priv_bits = buf.read('bin:5')
+    if header.standart == consts.Standards.MPEG_1:
+        sideinfo.granules = 2
+        sideinfo.main_data_start = read_bits(9)
+        sideinfo.priv_bits = format(read_bits(5), '05b') if mono \
+            else format(read_bits(3), '03b')
+        for ch in range(0, channels):
+            scfsi = read_bits(4)
+            sideinfo.scale_factor_selection[ch] = [
+                (scfsi >> 3) & 1, (scfsi >> 2) & 1, (scfsi >> 1) & 1, scfsi & 1
+            ]
+        scalefac_compress_bits = 4
     else:
-        sideinfo.priv_bits = buf.read('bin:3')
-    # print("Sideinfo priv bits:", sideinfo.priv_bits)
-
-    for ch in range(0, header.channels_count()):
-        for band in range(0, 4):
-            sideinfo.scale_factor_selection[ch][band] = read_bits(1)
-    # print('Sideinfo scfsi:', sideinfo.scale_factor_selection)
+        # MPEG 2/2.5 LSF: single granule, no scfsi, 9-bit scalefac_compress
+        sideinfo.granules = 1
+        sideinfo.main_data_start = read_bits(8)
+        sideinfo.priv_bits = format(read_bits(1), '01b') if mono \
+            else format(read_bits(2), '02b')
+        scalefac_compress_bits = 9
 
-    # for gr in range(0, 2):
-    #     for ch in range(0, header.channels_count()):
-    #         sideinfo.part_23_length[gr][ch] = read_bits(12)
-    #         sideinfo.big_values[gr][ch] = read_bits(9)
-    #         sideinfo.global_gain[gr][ch] = read_bits(8)
-    #         sideinfo.scalefac_compress[gr][ch] = read_bits(4)
-    #         sideinfo.win_switch_flag[gr][ch] = read_bits(1)
-    #         if sideinfo.win_switch_flag[gr][ch] == 1:
-    #             sideinfo.block_type[gr][ch] = read_bits(2)
-    #             sideinfo.mixed_block_flag[gr][ch] = read_bits(1)
-    #             for region in range(0, 2):
-    #                 sideinfo.table_select[gr][ch][region] = read_bits(5)
-    #             for window in range(0, 3):
-    #                 sideinfo.subblock_gain[gr][ch][window] = read_bits(3)
-    #             if sideinfo.block_type[gr][ch] == consts.WindowType.Short \
-    #                     and sideinfo.mixed_block_flag[gr][ch] == 0:
-    #                 sideinfo.region0_count[gr][ch] = 8
-    #             else:
-    #                 sideinfo.region0_count[gr][ch] = 7
-    #             sideinfo.region1_count[gr][ch] = \
-    #                 20 - sideinfo.region0_count[gr][ch]
-    #         else:
-    #             for region in range(0, 3):
-    #                 sideinfo.table_select[gr][ch][region] = read_bits(5)
-    #             sideinfo.region0_count[gr][ch] = read_bits(4)
-    #             sideinfo.region1_count[gr][ch] = read_bits(3)
-    #             sideinfo.block_type[gr][ch] = consts.WindowType.Forbidden
-    #         sideinfo.preflag[gr][ch] = read_bits(1)
-    #         sideinfo.scalefac_scale[gr][ch] = read_bits(1)
-    #         sideinfo.count1_table_select[gr][ch] = read_bits(1)
+    for gr in range(0, sideinfo.granules):
+        for ch in range(0, channels):
+            sideinfo.part_23_length[gr][ch] = read_bits(12)
+            sideinfo.big_values[gr][ch] = read_bits(9)
+            sideinfo.global_gain[gr][ch] = read_bits(8)
+            sideinfo.scalefac_compress[gr][ch] = \
+                read_bits(scalefac_compress_bits)
+            sideinfo.win_switch_flag[gr][ch] = read_bits(1)
+            table_select = sideinfo.table_select[gr][ch]
+            if sideinfo.win_switch_flag[gr][ch] == 1:
+                block_type = read_bits(2)
+                mixed_block_flag = read_bits(1)
+                sideinfo.block_type[gr][ch] = block_type
+                sideinfo.mixed_block_flag[gr][ch] = mixed_block_flag
+                table_select[0] = read_bits(5)
+                table_select[1] = read_bits(5)
+                subblock_gain = sideinfo.subblock_gain[gr][ch]
+                subblock_gain[0] = read_bits(3)
+                subblock_gain[1] = read_bits(3)
+                subblock_gain[2] = read_bits(3)
+                if block_type == consts.WindowType.Short \
+                        and mixed_block_flag == 0:
+                    sideinfo.region0_count[gr][ch] = 8
+                else:
+                    sideinfo.region0_count[gr][ch] = 7
+                sideinfo.region1_count[gr][ch] = \
+                    20 - sideinfo.region0_count[gr][ch]
+            else:
+                table_select[0] = read_bits(5)
+                table_select[1] = read_bits(5)
+                table_select[2] = read_bits(5)
+                sideinfo.region0_count[gr][ch] = read_bits(4)
+                sideinfo.region1_count[gr][ch] = read_bits(3)
+                sideinfo.block_type[gr][ch] = consts.WindowType.Forbidden
+            if sideinfo.granules == 2:
+                sideinfo.preflag[gr][ch] = read_bits(1)
+            sideinfo.scalefac_scale[gr][ch] = read_bits(1)
+            sideinfo.count1_table_select[gr][ch] = read_bits(1)
     return sideinfo
@@ -0,0 +1,125 @@
+import struct
+
+from . import frame, meta
+
+APE_MAGIC = b'APETAGEX'
+APE_HEADER_SIZE = 32
+APE_IS_HEADER = 1 << 29
+
+# Longest possible frame (MPEG-1 Layer II/III 384/320 kbps at 32 kHz with
+# padding is 1441 bytes, Layer I 448 kbps at 32 kHz is 676) plus next header
+LOOKAHEAD = 4096
+
+# Sync word, standard, layer and samplerate bits must match between frames
+# of one stream
+STREAM_MASK = 0xfffe0c00
+
+TAG_MAGICS = (meta.ID3V2_MAGIC, meta.ID3V1_MAGIC, APE_MAGIC)
+
+
+class Skipped:
+    """Junk bytes skipped while looking for next frame"""
+
+    def __init__(self, offset, length, reason='junk'):
+        self.offset = offset
+        self.length = length
+        self.reason = reason
+
+    def print(self):
+        print(f"Skipped {self.length} bytes of {self.reason} "
+              f"at offset {self.offset}")
+
+
+def is_valid_header(raw_header) -> bool:
+    """Checks sync word and that no field has reserved/unsupported value
+    (free format and bad bitrates, reserved standard/layer/samplerate)"""
+    if frame.cached_header(raw_header) is not None:
+        return True
+    if len(raw_header) < 4:
+        return False
+    value, = struct.unpack_from('>I', raw_header)
+    return ((value >> 21) == 0x7ff
+            and (value >> 19) & 0b11 != 0b01
+            and (value >> 17) & 0b11 != 0b00
+            and (value >> 12) & 0b1111 not in (0b0000, 0b1111)
+            and (value >> 10) & 0b11 != 0b11
+            and value & 0b11 != 0b10)
+
+
+def is_item_start(raw_header) -> bool:
+    """raw_header = 4 bytes, checks they may start frame or tag"""
+    return is_valid_header(raw_header) \
+        or raw_header[:3] in (meta.ID3V2_MAGIC, meta.ID3V1_MAGIC) \
+        or raw_header == APE_MAGIC[:4]
+
+
+def is_tag_start(buffer, pos) -> bool:
+    return any(buffer[pos:pos + len(magic)] == magic for magic in TAG_MAGICS)
+
+
+def confirm_tag(buffer, pos) -> bool:
+    """Rejects tag magics found by chance inside junk: ID3v2 header must
+    have sane version and synchsafe size, ID3v1 must be followed by end of
+    buffer or frame"""
+    if buffer[pos:pos + 3] == meta.ID3V2_MAGIC:
+        header = bytes(buffer[pos + 3:pos + 10])
+        return len(header) == 7 and header[0] < 0xff and header[1] < 0xff \
+            and all(byte < 0x80 for byte in header[3:])
+    if buffer[pos:pos + 3] == meta.ID3V1_MAGIC:
+        next_pos = pos + 128
+        return next_pos == len(buffer) \
+            or is_valid_header(bytes(buffer[next_pos:next_pos + 4]))
+    return buffer[pos:pos + len(APE_MAGIC)] == APE_MAGIC
+
+
+def confirm_frame(buffer, pos) -> bool:
+    """Candidate at pos is accepted when next frame (or tag) starts exactly
+    where this one ends, or when the frame runs to the end of buffer"""
+    raw_header = bytes(buffer[pos:pos + 4])
+    if not is_valid_header(raw_header):
+        return False
+    next_pos = pos + int(frame.header_from_bytes(raw_header, cache=False)
+                         .frame_length)
+    if next_pos + 4 > len(buffer):
+        return True
+    next_header = bytes(buffer[next_pos:next_pos + 4])
+    if is_valid_header(next_header):
+        mask = STREAM_MASK
+        return int.from_bytes(raw_header, 'big') & mask \
+            == int.from_bytes(next_header, 'big') & mask
+    return is_tag_start(buffer, next_pos)
+
+
+def find_sync(buffer, start=0, end=None) -> int:
+    """Returns position of first confirmed frame or tag starting in
+    [start, end) or -1. buffer must support find() (bytes, bytearray,
+    mmap); candidates are located with find(), not byte-by-byte"""
+    if end is None:
+        end = len(buffer)
+    pos = start
+    while pos < end:
+        candidate = buffer.find(b'\xff', pos, end)
+        if candidate < 0:
+            candidate = end
+        # tags are searched only up to the next sync candidate, which keeps
+        # whole search linear in scanned bytes
+        for magic in TAG_MAGICS:
+            tag_pos = buffer.find(magic, pos, candidate + len(magic) - 1)
+            if 0 <= tag_pos < candidate:
+                candidate = tag_pos
+        if candidate >= end:
+            return -1
+        if buffer[candidate] == 0xff:
+            if confirm_frame(buffer, candidate):
+                return candidate
+        elif confirm_tag(buffer, candidate):
+            return candidate
+        pos = candidate + 1
+    return -1
+
+
+def ape_tag_length(raw_header) -> int:
+    """raw_header = 32 bytes of APE tag header or footer. Returns number of
+    bytes to skip after it: whole tag for header, nothing for footer"""
+    size, items, flags = struct.unpack_from('<III', raw_header, 12)
+    return size if flags & APE_IS_HEADER else 0
@@ -0,0 +1,291 @@
+import functools
+import math
+
+import numpy
+
+from . import consts, decoder, frame, layer3
+
+SUBBANDS = 32
+SLOTS = 18
+
+# Polyphase window D[0..511]
+_half = numpy.array(consts.SYNTHESIS_WINDOW, dtype=numpy.float64) / 65536
+SYNTHESIS_WINDOW = numpy.concatenate((_half, _half[255:0:-1])) \
+    * numpy.where(numpy.arange(512) // 64 % 2, -1.0, 1.0)
+# D reshaped so that [m, 0] / [m, 1] are the coefficients applied to the
+# first / second half of the V vector 2m slots back
+_WINDOW_ROWS = SYNTHESIS_WINDOW.reshape(8, 2, 32)
+
+# Matrixing of 32 subband samples into 64 V values
+_k = numpy.arange(SUBBANDS)
+POLYPHASE_MATRIX = numpy.cos(
+    (16 + numpy.arange(64))[None, :] * (2 * _k[:, None] + 1) * math.pi / 64)
+
+_c = numpy.array(consts.ANTIALIAS_COEFFICIENTS)
+ANTIALIAS_CS = 1 / numpy.sqrt(1 + _c * _c)
+ANTIALIAS_CA = _c / numpy.sqrt(1 + _c * _c)
+
+
+def imdct_matrix(n):
+    """n/2 frequency lines -> n windowless time samples"""
+    half = n // 2
+    i = numpy.arange(n)[None, :]
+    k = numpy.arange(half)[:, None]
+    return numpy.cos(math.pi / (2 * n) * (2 * i + 1 + half) * (2 * k + 1))
+
+
+def long_windows():
+    """IMDCT windows of long blocks indexed by consts.WindowType"""
+    i = numpy.arange(36)
+    normal = numpy.sin(math.pi / 36 * (i + 0.5))
+    short_rise = numpy.sin(math.pi / 12 * (numpy.arange(6) + 0.5))
+    start = normal.copy()
+    start[18:24] = 1
+    start[24:30] = short_rise[::-1]
+    start[30:] = 0
+    end = normal.copy()
+    end[:6] = 0
+    end[6:12] = short_rise
+    end[12:18] = 1
+    return numpy.array([normal, start, normal, end])
+
+
+IMDCT_LONG = imdct_matrix(36)[None, :, :] * long_windows()[:, None, :]
+IMDCT_SHORT = imdct_matrix(12) \
+    * numpy.sin(math.pi / 12 * (numpy.arange(12) + 0.5))
+
+
+@functools.lru_cache(maxsize=None)
+def reorder_indices(layout: layer3.BandLayout):
+    """Line permutation taking short bands from window by window order to
+    frequency order with windows interleaved"""
+    order = numpy.arange(layer3.LINES)
+    for first in range(layout.long_bands, layout.slots, 3):
+        lines = numpy.flatnonzero((layout.slot >= first)
+                                  & (layout.slot < first + 3))
+        start, width = lines[0], len(lines) // 3
+        order[start:start + 3 * width] = \
+            start + numpy.arange(3 * width).reshape(3, width).T.ravel()
+    return order
+
+
+def count_long_subbands(layout: layer3.BandLayout):
+    """Subbands transformed as long blocks: all of them, none for short
+    blocks, the ones covered by long bands of mixed blocks"""
+    if not layout.short:
+        return SUBBANDS
+    return int(numpy.argmax(layout.window >= 0)) // SLOTS
+
+
+def intensity_positions(header, si, gr, right: layer3.GranuleData):
+    """Returns (left gain, right gain) for every line of the right channel's
+    zero region coded as intensity stereo, NaN for other lines"""
+    layout = right.layout
+    mpeg1 = header.standart == consts.Standards.MPEG_1
+    slots = layout.slots
+    used = numpy.zeros(slots, dtype=bool)
+    used[layout.slot[numpy.flatnonzero(right.xr)]] = True
+
+    # zero region starts after the last nonzero slot, short blocks have one
+    # per window unless long bands come first
+    windows = 3 if layout.short and not layout.long_bands else 1
+    region_start = []
+    for window in range(windows):
+        nonzero = numpy.flatnonzero(used[window::windows])
+        region_start.append(window + windows * (nonzero[-1] + 1)
+                            if len(nonzero) else window)
+
+    # last band carries no scalefactor: it repeats the previous one, or is
+    # centered when intensity starts there
+    positions = list(right.scalefac)
+    bits = list(right.scalefac_bits)
+    blocks = 3 if layout.short else 1
+    for window in range(blocks):
+        last, previous = slots - blocks + window, slots - 2 * blocks + window
+        if region_start[window % windows] > previous:
+            positions[last], bits[last] = 3 if mpeg1 else 0, 0
+        else:
+            positions[last], bits[last] = positions[previous], bits[previous]
+
+    left_gain = numpy.full(slots, numpy.nan)
+    right_gain = numpy.full(slots, numpy.nan)
+    io = 2 ** (-0.5 if si.scalefac_compress[gr][1] & 1 else -0.25)
+    for slot in range(slots):
+        if slot < region_start[slot % windows]:
+            continue
+        position = positions[slot]
+        if mpeg1:
+            if position >= 7:
+                continue
+            angle = position * math.pi / 12
+            total = math.sin(angle) + math.cos(angle)
+            left_gain[slot] = math.sin(angle) / total
+            right_gain[slot] = math.cos(angle) / total
+        elif bits[slot] and position == (1 << bits[slot]) - 1:
+            continue
+        elif position & 1:
+            left_gain[slot] = io ** ((position + 1) // 2)
+            right_gain[slot] = 1.0
+        else:
+            left_gain[slot] = 1.0
+            right_gain[slot] = io ** (position // 2)
+    return left_gain[layout.slot], right_gain[layout.slot]
+
+
+def process_stereo(header, si, gr, left: layer3.GranuleData,
+                   right: layer3.GranuleData):
+    """Joint stereo: middle/side and intensity stereo in place"""
+    ms = header.use_middle_side_stereo()
+    lines = slice(None)
+    if header.use_intensity_stereo():
+        left_gain, right_gain = intensity_positions(header, si, gr, right)
+        intensity = ~numpy.isnan(left_gain)
+        right.xr[intensity] = left.xr[intensity] * right_gain[intensity]
+        left.xr[intensity] *= left_gain[intensity]
+        lines = ~intensity
+    if ms:
+        middle, side = left.xr[lines], right.xr[lines]
+        left.xr[lines], right.xr[lines] = \
+            (middle + side) * math.sqrt(0.5), (middle - side) * math.sqrt(0.5)
+
+
+def antialias(xr, subbands):
+    """Butterflies between first subbands (count) with their neighbours,
+    xr = (32, 18) view"""
+    if subbands < 2:
+        return
+    lower = xr[:subbands - 1, 17:9:-1].copy()
+    upper = xr[1:subbands, :8].copy()
+    xr[:subbands - 1, 17:9:-1] = lower * ANTIALIAS_CS - upper * ANTIALIAS_CA
+    xr[1:subbands, :8] = upper * ANTIALIAS_CS + lower * ANTIALIAS_CA
+
+
+def imdct(xr, block_type, long_subbands):
+    """xr = (32, 18) lines, returns (32, 36) windowed time samples. First
+    long_subbands use long transform, the rest three short ones"""
+    out = numpy.zeros((SUBBANDS, 36))
+    if long_subbands:
+        out[:long_subbands] = xr[:long_subbands] @ IMDCT_LONG[block_type]
+    if long_subbands < SUBBANDS:
+        # short windows are interleaved: line 3k + w is window w line k
+        windows = xr[long_subbands:].reshape(-1, 6, 3)
+        short = numpy.einsum('skw,kj->swj', windows, IMDCT_SHORT)
+        for w in range(3):
+            out[long_subbands:, 6 + 6 * w:18 + 6 * w] += short[:, w]
+    return out
+
+
+class Synthesizer:
+    """Layer III synthesis of one stream: stereo processing, reordering,
+    antialias, IMDCT and polyphase filterbank. Keeps IMDCT overlap and
+    polyphase history of every channel, so frames must come in stream
+    order"""
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.overlap = numpy.zeros((channels, SUBBANDS, SLOTS))
+        self.history = numpy.zeros((channels, 15, 64))
+
+    def subband_samples(self, header, si, granules):
+        """granules = layer3.GranuleData list [granule][channel] or None
+        when main data is lost. Returns (channels, 18 * granules, 32)
+        subband samples"""
+        samples = numpy.zeros((self.channels, si.granules * SLOTS, SUBBANDS))
+        for gr in range(si.granules):
+            channels = granules[gr] if granules else None
+            if channels and len(channels) == 2:
+                process_stereo(header, si, gr, *channels)
+            for ch in range(self.channels):
+                if channels:
+                    granule = channels[ch]
+                    xr = granule.xr
+                    if granule.layout.short:
+                        xr = xr[reorder_indices(granule.layout)]
+                    xr = xr.reshape(SUBBANDS, SLOTS)
+                    block_type = si.block_type[gr][ch] \
+                        if si.win_switch_flag[gr][ch] else 0
+                    long_subbands = count_long_subbands(granule.layout)
+                else:
+                    xr = numpy.zeros((SUBBANDS, SLOTS))
+                    block_type, long_subbands = 0, SUBBANDS
+                antialias(xr, long_subbands)
+                out = imdct(xr, 0 if long_subbands < SUBBANDS else
+                            block_type, long_subbands)
+                time = out[:, :SLOTS] + self.overlap[ch]
+                self.overlap[ch] = out[:, SLOTS:]
+                # frequency inversion of odd subbands
+                time[1::2, 1::2] *= -1
+                samples[ch, gr * SLOTS:(gr + 1) * SLOTS] = time.T
+        return samples
+
+    def polyphase(self, samples):
+        """samples = (channels, slots, 32) subband samples. Returns
+        (slots * 32, channels) PCM, 1.0 is full scale"""
+        channels, slots, _ = samples.shape
+        pcm = numpy.empty((channels, slots, SUBBANDS))
+        for ch in range(channels):
+            v = numpy.concatenate((self.history[ch],
+                                   samples[ch] @ POLYPHASE_MATRIX))
+            out = pcm[ch]
+            out[:] = 0
+            for m in range(8):
+                current = v[15 - 2 * m:15 - 2 * m + slots, :32]
+                previous = v[14 - 2 * m:14 - 2 * m + slots, 32:]
+                out += current * _WINDOW_ROWS[m, 0] \
+                    + previous * _WINDOW_ROWS[m, 1]
+            self.history[ch] = v[-15:]
+        return numpy.ascontiguousarray(pcm.reshape(channels, -1).T)
+
+    def synthesize(self, frames):
+        """frames = [(header, sideinfo, granules)], decoded in one batch.
+        Returns (samples, channels) float64 PCM"""
+        if not frames:
+            return numpy.zeros((0, self.channels))
+        samples = numpy.concatenate(
+            [self.subband_samples(*item) for item in frames], axis=1)
+        return self.polyphase(samples)
+
+
+def to_dtype(pcm, dtype):
+    dtype = numpy.dtype(dtype)
+    if dtype.kind == 'f':
+        return pcm.astype(dtype)
+    info = numpy.iinfo(dtype)
+    scaled = numpy.rint(pcm * (info.max + 1))
+    return numpy.clip(scaled, info.min, info.max).astype(dtype)
+
+
+def iter_pcm(file, dtype=numpy.int16, batch=32, use_mmap=True,
+             resync=True):
+    """Decodes Layer III audio of file. Yields (samples, channels) arrays
+    of dtype (integers use their full range, floats are not clipped)
+    covering up to batch frames each. Other layers are skipped, frames
+    whose main data is lost play as silence"""
+    for _, pcm in iter_blocks(file, dtype, batch, use_mmap, resync):
+        yield pcm
+
+
+def iter_blocks(file, dtype=numpy.int16, batch=32, use_mmap=True,
+                resync=True):
+    """Same as iter_pcm, yields (frame.Header of first frame, PCM)"""
+    synthesizer = None
+    pending = []
+    for item in decoder.iter_frames(file, use_mmap, resync=resync,
+                                    tag_frames=(), decode_audio=True):
+        # Xing/VBRI and truncated frames carry no sideinfo
+        if not isinstance(item, frame.Frame) or item.sideinfo is None:
+            continue
+        channels = item.header.channels_count()
+        if synthesizer is None or synthesizer.channels != channels:
+            if pending:
+                yield pending[0][0], to_dtype(
+                    synthesizer.synthesize(pending), dtype)
+                pending = []
+            synthesizer = Synthesizer(channels)
+        pending.append((item.header, item.sideinfo, item.granules))
+        if len(pending) >= batch:
+            yield pending[0][0], to_dtype(synthesizer.synthesize(pending),
+                                          dtype)
+            pending = []
+    if pending:
+        yield pending[0][0], to_dtype(synthesizer.synthesize(pending), dtype)
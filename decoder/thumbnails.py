@@ -0,0 +1,90 @@
+import collections
+import hashlib
+import io
+import os
+import tempfile
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from . import cache
+
+DEFAULT_DIRECTORY = os.path.join(cache.DEFAULT_DIRECTORY, 'covers')
+DEFAULT_MAX_ITEMS = 64
+DEFAULT_MAX_SIZE = 32 * 2 ** 20
+
+
+class ThumbnailCache:
+    """Square album cover thumbnails keyed by sha1 of the image bytes, so
+    tracks of one album share one decode. Thumbnails are kept in an
+    in-memory LRU of max_items PIL images and, when directory is given,
+    as PNG files evicted the same way as frame index cache entries"""
+
+    def __init__(self, size, directory=None, max_items=DEFAULT_MAX_ITEMS,
+                 max_size=DEFAULT_MAX_SIZE):
+        if Image is None:
+            raise BaseException('Pillow is not installed')
+        self.size = size
+        self.directory = directory
+        self.max_items = max_items
+        self.max_size = max_size
+        self.images = collections.OrderedDict()
+
+    def get(self, data):
+        """data = encoded image bytes, returns RGB PIL image of size x size"""
+        key = hashlib.sha1(data).hexdigest()
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+            return image
+        image = self.load(key)
+        if image is None:
+            image = make_thumbnail(data, self.size)
+            self.store(key, image)
+        self.images[key] = image
+        if len(self.images) > self.max_items:
+            self.images.popitem(last=False)
+        return image
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, f'{key}-{self.size}.png')
+
+    def load(self, key):
+        if self.directory is None:
+            return None
+        path = self.entry_path(key)
+        try:
+            with Image.open(path) as image:
+                image.load()
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return image
+
+    def store(self, key, image):
+        """Disk tier is best effort, unwritable directory is ignored"""
+        if self.directory is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory,
+                                            suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    image.save(file, 'PNG')
+                os.replace(tmp_path, self.entry_path(key))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            cache.evict(self.directory, self.max_size, '.png')
+        except OSError:
+            pass
+
+
+def make_thumbnail(data, size):
+    image = Image.open(io.BytesIO(data))
+    # JPEG is decoded at 1/2, 1/4 or 1/8 scale when that still covers size
+    image.draft('RGB', (size, size))
+    return image.convert('RGB').resize((size, size), Image.LANCZOS)
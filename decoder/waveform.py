@@ -0,0 +1,222 @@
+import os
+import struct
+import tempfile
+from array import array
+
+import numpy
+
+from . import synthesis
+
+MAGIC = b'MP3PKS'
+VERSION = 1
+# sidecar file name is track file name plus suffix
+SUFFIX = '.peaks'
+
+# Samples per bucket of the finest zoom level, every next level merges
+# FACTOR buckets. 1024 samples keep an hour of 44.1 kHz audio around 1 MB
+BUCKET = 1024
+FACTOR = 4
+LEVELS = 6
+
+# magic, version, source size, source mtime, samplerate, samples count,
+# bucket, factor, levels count. Followed by buckets count of every level
+# and (minimum, maximum, rms) int16 rows of every level
+HEADER = struct.Struct('<6sHQqIQIHH')
+SCALE = 32767
+
+
+class Peaks:
+    """Waveform summary: levels[i] = (minimum, maximum, rms) float32 arrays,
+    one value per bucket of bucket * factor ** i mono samples"""
+
+    def __init__(self, samplerate, samples, levels, bucket=BUCKET,
+                 factor=FACTOR):
+        self.samplerate = samplerate
+        self.samples = samples
+        self.levels = levels
+        self.bucket = bucket
+        self.factor = factor
+
+    @property
+    def duration(self):
+        return self.samples / self.samplerate if self.samplerate else 0.0
+
+    def level_for(self, width) -> int:
+        """Coarsest level that still has a bucket for every column"""
+        for level in range(len(self.levels) - 1, 0, -1):
+            if len(self.levels[level][0]) >= width:
+                return level
+        return 0
+
+    def columns(self, width):
+        """Returns (minimum, maximum, rms) arrays of width values"""
+        minimum, maximum, rms = self.levels[self.level_for(width)]
+        if not len(minimum):
+            return (numpy.zeros(width, dtype=numpy.float32),) * 3
+        starts = numpy.linspace(0, len(minimum), width, endpoint=False)
+        starts = starts.astype(numpy.intp)
+        counts = numpy.diff(numpy.append(starts, len(minimum)))
+        counts = numpy.maximum(counts, 1)
+        power = numpy.add.reduceat(rms * rms, starts) / counts
+        return (numpy.minimum.reduceat(minimum, starts),
+                numpy.maximum.reduceat(maximum, starts),
+                numpy.sqrt(power).astype(numpy.float32))
+
+
+class PeakBuilder:
+    """Streaming summary: add() PCM chunks as they are decoded, finish()
+    returns Peaks. Only the finest level and less than one bucket of
+    samples are kept between chunks"""
+
+    def __init__(self, samplerate, bucket=BUCKET, factor=FACTOR,
+                 levels=LEVELS):
+        self.samplerate = samplerate
+        self.bucket = bucket
+        self.factor = factor
+        self.levels_count = levels
+        self.samples = 0
+        self.rest = numpy.zeros(0, dtype=numpy.float32)
+        self.minimum = []
+        self.maximum = []
+        self.power = []
+
+    def add(self, pcm):
+        """pcm = (samples, channels) float array, 1.0 is full scale"""
+        mono = pcm.mean(axis=1, dtype=numpy.float32) if pcm.ndim == 2 \
+            else numpy.asarray(pcm, dtype=numpy.float32)
+        self.samples += len(mono)
+        if len(self.rest):
+            mono = numpy.concatenate((self.rest, mono))
+        full = len(mono) // self.bucket * self.bucket
+        self.add_buckets(mono[:full].reshape(-1, self.bucket))
+        self.rest = mono[full:].copy()
+
+    def add_buckets(self, buckets):
+        if len(buckets):
+            self.minimum.append(buckets.min(axis=1))
+            self.maximum.append(buckets.max(axis=1))
+            self.power.append(numpy.mean(buckets * buckets, axis=1))
+
+    def finish(self) -> Peaks:
+        if len(self.rest):
+            # partial last bucket averages over its own length
+            self.add_buckets(self.rest[None, :])
+            self.rest = self.rest[:0]
+        empty = numpy.zeros(0, dtype=numpy.float32)
+        minimum = numpy.concatenate(self.minimum) if self.minimum else empty
+        maximum = numpy.concatenate(self.maximum) if self.maximum else empty
+        power = numpy.concatenate(self.power) if self.power else empty
+
+        levels = []
+        for _ in range(self.levels_count):
+            levels.append((minimum, maximum,
+                           numpy.sqrt(power).astype(numpy.float32)))
+            minimum = merge(minimum, self.factor, numpy.min)
+            maximum = merge(maximum, self.factor, numpy.max)
+            power = merge(power, self.factor, numpy.mean)
+        return Peaks(self.samplerate, self.samples, levels, self.bucket,
+                     self.factor)
+
+
+def merge(values, factor, reduce):
+    """Reduces every factor values into one, last group repeats its edge"""
+    if not len(values):
+        return values
+    count = -(-len(values) // factor)
+    padded = numpy.pad(values, (0, count * factor - len(values)), 'edge')
+    return reduce(padded.reshape(count, factor), axis=1)
+
+
+def summarize(file, use_mmap=True) -> Peaks:
+    """Decodes Layer III audio of file and summarizes it"""
+    builder = None
+    for header, pcm in synthesis.iter_blocks(file, numpy.float32,
+                                             use_mmap=use_mmap):
+        if builder is None:
+            builder = PeakBuilder(header.samplerate)
+        builder.add(pcm)
+    return (builder or PeakBuilder(0)).finish()
+
+
+def load_peaks(path) -> Peaks:
+    """Returns summary of track at path from its sidecar file. Missing or
+    outdated sidecar is rebuilt, unwritable directory only costs the
+    rebuild next time"""
+    stat = os.stat(path)
+    try:
+        with open(path + SUFFIX, 'rb') as file:
+            peaks = load(file, stat)
+    except (OSError, EOFError, ValueError, struct.error):
+        peaks = None
+    if peaks is None:
+        with open(path, 'rb') as file:
+            peaks = summarize(file)
+        try:
+            save(path, peaks, stat)
+        except OSError:
+            pass
+    return peaks
+
+
+def save(path, peaks: Peaks, stat):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            dump(peaks, file, stat)
+        os.replace(tmp_path, path + SUFFIX)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def dump(peaks: Peaks, file, stat):
+    """stat = os.stat_result of the track, sidecar is valid while its size
+    and mtime don't change"""
+    file.write(HEADER.pack(MAGIC, VERSION, stat.st_size, stat.st_mtime_ns,
+                           peaks.samplerate, peaks.samples, peaks.bucket,
+                           peaks.factor, len(peaks.levels)))
+    file.write(array('I', [len(level[0]) for level in peaks.levels])
+               .tobytes())
+    for level in peaks.levels:
+        values = numpy.rint(numpy.clip(numpy.stack(level), -1, 1) * SCALE)
+        file.write(values.astype('<i2').tobytes())
+
+
+def load(file, stat=None):
+    """Returns Peaks or None if file isn't a compatible sidecar of the track
+    with given stat"""
+    (magic, version, size, mtime, samplerate, samples, bucket, factor,
+     levels_count) = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        return None
+    if stat is not None and (size, mtime) != (stat.st_size,
+                                              stat.st_mtime_ns):
+        return None
+    counts = array('I')
+    counts.frombytes(file.read(levels_count * counts.itemsize))
+    levels = []
+    for count in counts:
+        data = file.read(3 * count * 2)
+        if len(data) != 3 * count * 2:
+            raise EOFError('Truncated peaks file')
+        values = numpy.frombuffer(data, '<i2').reshape(3, count)
+        levels.append(tuple(values.astype(numpy.float32) / SCALE))
+    return Peaks(samplerate, samples, levels, bucket, factor)
+
+
+def render(peaks: Peaks, width, height, color=(32, 32, 32),
+           rms_color=(96, 96, 160)):
+    """Draws waveform in one pass, returns (height, width, 4) uint8 RGBA
+    array with transparent background: min/max envelope in color, RMS in
+    rms_color"""
+    minimum, maximum, rms = peaks.columns(width)
+    middle = (height - 1) / 2
+    rows = numpy.arange(height)[:, None]
+    envelope = (rows >= numpy.floor(middle - maximum * middle)) \
+        & (rows <= numpy.ceil(middle - minimum * middle))
+    body = envelope & (numpy.abs(rows - middle) <= rms * middle)
+    image = numpy.zeros((height, width, 4), dtype=numpy.uint8)
+    image[envelope] = (*color, 255)
+    image[body] = (*rms_color, 255)
+    return image
@@ -0,0 +1,73 @@
+import threading
+
+from . import decoder, frame, meta
+
+# Frames parsed between progress updates
+BATCH = 4096
+
+
+class ParseJob:
+    """Parses file on worker thread. on_update(job) is called from the
+    worker when a tag is found, after every batch frames and once at the
+    end (job.done, job.error). Only the first job.frames_count frames of
+    job.data are complete, the rest may be half-appended. Cached index is
+    published at once, fresh results are stored in index_cache"""
+
+    def __init__(self, path, on_update, index_cache=None, batch=BATCH):
+        self.path = path
+        self.on_update = on_update
+        self.index_cache = index_cache
+        self.batch = batch
+        self.data = decoder.File()
+        self.frames_count = 0
+        self.done = False
+        self.error = None
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        """Worker stops at the next item, no more updates are sent"""
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            self.parse()
+        except Exception as e:
+            self.error = e
+        self.done = True
+        if not self.cancelled.is_set():
+            self.on_update(self)
+
+    def parse(self):
+        cached = self.index_cache.get(self.path) \
+            if self.index_cache is not None else None
+        if cached is not None:
+            self.data = cached
+            self.frames_count = len(cached.frames)
+            return
+
+        data = self.data
+        with open(self.path, 'rb') as file:
+            for item in decoder.iter_frames(file):
+                if self.cancelled.is_set():
+                    return
+                data.append(item)
+                if isinstance(item, frame.Frame):
+                    if len(data.frames) - self.frames_count >= self.batch:
+                        self.publish()
+                elif isinstance(item, (meta.MetaID3V1, meta.MetaID3V2)):
+                    self.publish()
+        self.frames_count = len(data.frames)
+        if self.index_cache is not None:
+            try:
+                self.index_cache.put(self.path, data)
+            except OSError:
+                pass
+
+    def publish(self):
+        self.frames_count = len(self.data.frames)
+        self.on_update(self)
@@ -1,37 +1,158 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
+import os
+import sys
+import time
 
-from decoder import decoder
+from decoder import batch, cache, crc, cut, decoder, frame, meta, sync
+
+
+def file_items(data: decoder.File):
+    if data.meta_id3v2:
+        yield data.meta_id3v2
+    yield from data.frames
+    if data.meta_id3v1:
+        yield data.meta_id3v1
 
-parser = argparse.ArgumentParser()
 
-parser.add_argument('file', type=argparse.FileType('rb'))
+def print_file(items):
+    frames_count = 0
+    meta_id3v1 = None
+    meta_id3v2 = None
+    for item in items:
+        if isinstance(item, frame.Frame):
+            if frames_count < 10:
+                item.header.print()
+                print()
+            frames_count += 1
+        elif isinstance(item, meta.MetaID3V1):
+            meta_id3v1 = item
+        elif isinstance(item, meta.MetaID3V2):
+            meta_id3v2 = item
+        elif isinstance(item, sync.Skipped):
+            item.print()
+            print()
 
-args = parser.parse_args()
+    if frames_count > 10:
+        print("... (Output truncated to first 10 frames)")
+        print()
 
-data = decoder.decode(args.file)
+    if meta_id3v1:
+        meta_id3v1.print()
+    else:
+        print("No ID3v1 tag")
 
-for frame in data.frames[:10]:
-    frame.header.print()
     print()
 
-if len(data.frames) > 10:
-    print("... (Output truncated to first 10 frames)")
+    if meta_id3v2:
+        meta_id3v2.print()
+    else:
+        print("No ID3v1 tag")
+
     print()
 
-if data.meta_id3v1:
-    data.meta_id3v1.print()
-else:
-    print("No ID3v1 tag")
+    print("Total", frames_count, "frames")
+
+
+def run_batch(args):
+    paths = list(args.batch or [])
+    if args.files_from:
+        with open(args.files_from) as files_list:
+            paths.extend(line.rstrip('\n') for line in files_list
+                         if line.strip())
 
-print()
+    started = time.perf_counter()
+    files_count = errors_count = bytes_count = 0
+    for record in batch.scan_library(batch.iter_paths(paths), args.jobs,
+                                     args.full, verify=args.verify):
+        print(json.dumps(record._asdict()), flush=True)
+        files_count += 1
+        bytes_count += record.size or 0
+        if record.error:
+            errors_count += 1
 
-if data.meta_id3v2:
-    data.meta_id3v2.print()
-else:
-    print("No ID3v1 tag")
+    elapsed = time.perf_counter() - started or 1e-9
+    print(f"Scanned {files_count} files ({errors_count} errors) "
+          f"in {elapsed:.2f}s: {files_count / elapsed:.1f} files/s, "
+          f"{bytes_count / elapsed / 2 ** 20:.1f} MB/s", file=sys.stderr)
+
+
+def run_cut(args):
+    path = args.file.name
+    args.file.close()
+    if args.cut:
+        start, end = args.cut
+        output = args.output or '{}-cut{}'.format(*os.path.splitext(path))
+        first, last = cut.cut(path, output, start, end, args.frames,
+                              not args.no_tags)
+        print(f"{output}: frames {first}-{last - 1}")
+    else:
+        for output in cut.split(path, args.split, args.output, args.frames,
+                                not args.no_tags):
+            print(output)
+
+
+parser = argparse.ArgumentParser()
 
-print()
+parser.add_argument('file', nargs='?', type=argparse.FileType('rb'))
+parser.add_argument('--batch', nargs='+', metavar='PATH',
+                    help='scan files and directories, print JSON lines')
+parser.add_argument('--files-from', metavar='LIST',
+                    help='batch scan paths listed in file, one per line')
+parser.add_argument('--jobs', type=int, default=None,
+                    help='batch worker processes (default: cpu count)')
+parser.add_argument('--full', action='store_true',
+                    help='batch scan decodes every frame instead of probing')
+parser.add_argument('--crc', choices=[mode.name.lower()
+                                      for mode in crc.CrcMode],
+                    default='skip',
+                    help='check CRC of protected frames, drop skips '
+                         'frames that fail it (default: skip)')
+parser.add_argument('--verify', action='store_true',
+                    help='batch scan checks CRC of protected frames')
+parser.add_argument('--cache', nargs='?', metavar='DIR',
+                    const=cache.DEFAULT_DIRECTORY,
+                    help='keep frame index of file in on-disk cache')
+parser.add_argument('--cut', nargs=2, type=float, metavar=('START', 'END'),
+                    help='copy part of file between START and END seconds '
+                         'to --output without re-encoding')
+parser.add_argument('--split', nargs='+', type=float, metavar='POINT',
+                    help='split file at POINTs (seconds) without '
+                         're-encoding')
+parser.add_argument('--output', metavar='PATH',
+                    help='--cut output file, --split name template with '
+                         '{stem}, {index} and {suffix} fields')
+parser.add_argument('--frames', action='store_true',
+                    help='--cut and --split positions are frame numbers')
+parser.add_argument('--no-tags', action='store_true',
+                    help='--cut and --split leave ID3 tags out')
 
-print("Total", len(data.frames), "frames")
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.batch or args.files_from:
+        run_batch(args)
+    elif args.file and (args.cut or args.split):
+        run_cut(args)
+    elif args.file and args.cache:
+        # cached index keeps every frame, failing ones can't be dropped
+        if args.crc == 'drop':
+            parser.error('--crc drop can\'t be used with --cache')
+        index_cache = cache.FrameIndexCache(args.cache)
+        print_file(file_items(index_cache.decode(args.file.name)))
+        if args.crc == 'verify':
+            print()
+            decoder.verify_crc(args.file).print()
+    elif args.file:
+        # Only headers are printed, so frame payloads are skipped, not parsed
+        crc_mode = crc.CrcMode[args.crc.capitalize()]
+        integrity = crc.IntegrityReport()
+        print_file(decoder.iter_frames(args.file, headers_only=True,
+                                       crc_mode=crc_mode,
+                                       integrity=integrity))
+        if crc_mode != crc.CrcMode.Skip:
+            print()
+            integrity.print()
+    else:
+        parser.error('file, --batch or --files-from is required')
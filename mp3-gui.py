@@ -6,17 +6,14 @@ import traceback
 import functools
 import threading
 import pyaudio
-import pydub
-import audioop
 from enum import Enum
-from pydub import utils
 from queue import Queue
 from PIL import Image, ImageTk
 from io import BytesIO
 from zlib import decompress
 from base64 import b85decode
 
-from decoder import decoder
+from decoder import cache, playback, thumbnails, waveform, worker
 
 
 def handle_error(func):
@@ -33,53 +30,76 @@ def handle_error(func):
 
 
 class PlayerState:
-    def __init__(self, player_queue):
-        self.player_queue: Queue = player_queue
+    def __init__(self, notify):
+        """notify(Mp3ThreadEvent) is called from the audio thread"""
+        self.notify = notify
         self.p = pyaudio.PyAudio()
 
         self.is_playing = False
-        self.segment = None
-        self.chunks = []
+        self.name = None
+        self.decoder = None
         self.stream = None
-        self.i = 0
 
         self._volume: float = 1.0
 
-    def set(self, name):
+    def set(self, name, offset=0):
+        """offset = byte offset of frame to start playback from. Stream is
+        opened stopped, playback continues after play()"""
+        self.close()
+        self.is_playing = False
+
+        self.name = name
+        # decoding continues on producer thread while first chunk plays
+        self.decoder = playback.DecodeAhead(name, offset)
+        if self.decoder.samplerate:
+            self.stream = self.p.open(
+                format=pyaudio.paInt16,
+                channels=self.decoder.channels,
+                rate=self.decoder.samplerate,
+                output=True,
+                start=False
+            )
+
+    def close(self):
+        if self.decoder:
+            self.decoder.close()
+            self.decoder = None
         if self.stream:
             self.stream.stop_stream()
             self.stream.close()
+            self.stream = None
 
-        self.segment = pydub.AudioSegment.from_mp3(name)
-        self.stream = self.p.open(
-            format=self.p.get_format_from_width(self.segment.sample_width),
-            channels=self.segment.channels,
-            rate=self.segment.frame_rate,
-            output=True
-        )
-        self.chunks = utils.make_chunks(self.segment, 50)
+    def seek(self, offset):
+        if self.name:
+            was_playing = self.is_playing
+            self.set(self.name, offset)
+            if was_playing:
+                self.play()
 
     def play(self):
-        if self.segment and self.stream:
+        if self.decoder and self.stream:
+            if self.stream.is_stopped():
+                self.stream.start_stream()
             self.is_playing = True
 
     def pause(self):
         self.is_playing = False
+        # stopped stream doesn't keep the device busy with silence
+        if self.stream:
+            self.stream.stop_stream()
 
     def update(self):
         if self.is_playing:
-            if self.i > len(self.chunks) - 1:
-                self.is_playing = False
-                self.i = 0
-                self.player_queue.put(Mp3ThreadEvent.Finished)
+            pcm = self.decoder.get()
+            if pcm is None:
+                if self.decoder.error:
+                    print('Playback error:', self.decoder.error)
+                # next play starts over
+                self.set(self.name)
+                self.notify(Mp3ThreadEvent.Finished)
             else:
-                data = self.chunks[self.i]
-                if self._volume < 1:
-                    data = data._spawn(data=audioop.mul(
-                        data._data, data.sample_width, self._volume
-                    ))
-                self.stream.write(data._data)
-                self.i += 1
+                self.stream.write(playback.scale(pcm, self._volume)
+                                  .tobytes())
 
     @property
     def volume(self) -> float:
@@ -96,6 +116,7 @@ class Mp3ThreadCommand(Enum):
     Pause = 1
     Set = 2
     Volume = 3
+    Seek = 4
 
 
 class Mp3ThreadEvent(Enum):
@@ -103,27 +124,32 @@ class Mp3ThreadEvent(Enum):
 
 
 class Mp3Thread(threading.Thread):
-    def __init__(self, gui_queue, player_queue):
+    def __init__(self, gui_queue, notify):
         super(Mp3Thread, self).__init__()
         self.gui_queue = gui_queue
-        self.player = PlayerState(player_queue)
+        self.player = PlayerState(notify)
 
     def run(self):
         while True:
-            if self.gui_queue.qsize():
-                command, args = self.gui_queue.get_nowait()
-                print('Mp3Thread loop command:', command, args)
-                if command == Mp3ThreadCommand.Set:
-                    self.player.set(args)
-                elif command == Mp3ThreadCommand.Play:
-                    self.player.play()
-                elif command == Mp3ThreadCommand.Pause:
-                    self.player.pause()
-                elif command == Mp3ThreadCommand.Volume:
-                    self.player.volume = args
-                else:
-                    break
-            self.player.update()
+            # blocking stream writes pace playback, commands are handled
+            # between chunks. Idle thread sleeps in queue get
+            if self.player.is_playing and self.gui_queue.empty():
+                self.player.update()
+                continue
+            command, args = self.gui_queue.get()
+            if command == Mp3ThreadCommand.Set:
+                self.player.set(args)
+            elif command == Mp3ThreadCommand.Play:
+                self.player.play()
+            elif command == Mp3ThreadCommand.Pause:
+                self.player.pause()
+            elif command == Mp3ThreadCommand.Volume:
+                self.player.volume = args
+            elif command == Mp3ThreadCommand.Seek:
+                self.player.seek(args)
+            else:
+                break
+        self.player.close()
 
 
 class Mp3FileGuiState:
@@ -132,6 +158,8 @@ class Mp3FileGuiState:
         self.hist = None
         self.album = None
         self.data = None
+        # (ID3v1, ID3v2) tags shown in panels
+        self.tags = (None, None)
         self.is_playing = False
 
 
@@ -196,6 +224,138 @@ class ID3v2TagFrame(MetaInfoFrame):
             self.set_text("File does not have ID3v2 tag")
 
 
+class FrameListView(tkinter.Frame):
+    """Frame list for files with any number of frames: Listbox only holds
+    the visible rows, they are rendered from the frame index on scroll.
+    Entry above the list jumps to frame number or time (83.5, 1:23.5).
+    on_select(frame number) is called on click, arrow keys and jumps"""
+    ROWS = 14
+
+    def __init__(self, master, on_select, width=16):
+        tkinter.Frame.__init__(self, master)
+        self.on_select = on_select
+        self.frames = None
+        # frames ready to show, first visible and selected frame numbers
+        self.count = 0
+        self.first = 0
+        self.selected = None
+
+        self.jump_entry = tkinter.Entry(self, width=width)
+        self.jump_entry.bind('<Return>', self.on_jump)
+        self.listbox = tkinter.Listbox(self, width=width, height=self.ROWS,
+                                       activestyle='none',
+                                       exportselection=False)
+        self.listbox.bind('<<ListboxSelect>>', self.on_row_selected)
+        self.listbox.bind('<MouseWheel>', self.on_wheel)
+        self.listbox.bind('<Button-4>', lambda e: self.scroll_by(-3))
+        self.listbox.bind('<Button-5>', lambda e: self.scroll_by(3))
+        self.listbox.bind('<Up>', lambda e: self.move_selection(-1))
+        self.listbox.bind('<Down>', lambda e: self.move_selection(1))
+        self.listbox.bind('<Prior>', lambda e: self.scroll_by(-self.ROWS))
+        self.listbox.bind('<Next>', lambda e: self.scroll_by(self.ROWS))
+        self.scrollbar = tkinter.Scrollbar(self, command=self.on_scroll)
+
+    def init(self):
+        self.jump_entry.grid(in_=self, column=0, row=0, columnspan=2,
+                             sticky='WE')
+        self.listbox.grid(in_=self, column=0, row=1)
+        self.scrollbar.grid(in_=self, column=1, row=1, sticky='NS')
+        self.render()
+
+    def set_frames(self, frames, count):
+        """frames = index.FrameIndex, only its first count frames are
+        shown (the rest may still be parsed)"""
+        self.frames = frames
+        self.count = count
+        self.render()
+
+    def clear(self):
+        self.frames = None
+        self.count = self.first = 0
+        self.selected = None
+        self.render()
+
+    def render(self):
+        self.first = max(0, min(self.first, self.count - self.ROWS))
+        last = min(self.first + self.ROWS, self.count)
+        self.listbox.delete(0, 'end')
+        if last > self.first:
+            times = self.frames.times
+            self.listbox.insert('end', *(
+                f'{i} {format_time(times[i])}'
+                for i in range(self.first, last)))
+        if self.selected is not None and self.first <= self.selected < last:
+            self.listbox.selection_set(self.selected - self.first)
+        if self.count:
+            self.scrollbar.set(self.first / self.count, last / self.count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll_by(self, rows):
+        self.first += rows
+        self.render()
+        return 'break'
+
+    def on_scroll(self, action, value, unit=None):
+        if action == 'moveto':
+            self.first = int(float(value) * self.count)
+            self.render()
+        elif unit == 'pages':
+            self.scroll_by(int(value) * self.ROWS)
+        else:
+            self.scroll_by(int(value))
+
+    def on_wheel(self, event):
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def on_row_selected(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            self.select(self.first + selection[0])
+
+    def move_selection(self, step):
+        if self.selected is not None:
+            self.select(max(0, min(self.selected + step, self.count - 1)))
+        return 'break'
+
+    def select(self, i):
+        """Selects frame i and scrolls it into view"""
+        if not self.first <= i < self.first + self.ROWS:
+            self.first = i - self.ROWS // 2
+        self.selected = i
+        self.render()
+        self.on_select(i)
+
+    def on_jump(self, event):
+        i = self.parse_jump(self.jump_entry.get().strip())
+        if i is None:
+            self.bell()
+        else:
+            self.select(i)
+
+    def parse_jump(self, text):
+        """Frame number, or time as seconds or [h:]m:s when text has a dot
+        or colon"""
+        if not self.count:
+            return None
+        try:
+            if ':' in text or '.' in text:
+                seconds = 0.0
+                for part in text.split(':'):
+                    seconds = seconds * 60 + float(part)
+                i = self.frames.frame_at(seconds)
+            else:
+                i = int(text)
+        except ValueError:
+            return None
+        return max(0, min(i, self.count - 1))
+
+
+def format_time(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    return f'{int(minutes)}:{seconds:05.2f}'
+
+
 GRID = 'c%17D@N?(olHy`uVBq!ia0y~yV4MKLOw2%$zZdVt11X*WpAgrZH*X#}a^yc4d' \
        '`MaL1Srl}666=m;PC858jy3-)5S5QV$R#M3wap~c~}lk_>%tV@Agk$7U&+$Ik' \
        'Uz#^IYfd_&Y%j4hjMsEKH4XYVHL8r*9H5go9PyKg-cX7oFgDVtLUw0}Nr!N#(' \
@@ -209,12 +369,13 @@ class Mp3Gui:
     HIST_SIZE = 250
     ALBUM_COVER_SIZE = 200
 
-    def __init__(self, gui_queue, player_queue):
+    def __init__(self, gui_queue):
         self.root = tkinter.Tk()
 
         self.gui_queue: Queue = gui_queue
-        self.player_queue: Queue = player_queue
         self.state = Mp3FileGuiState()
+        self.index_cache = cache.FrameIndexCache()
+        self.parse_job = None
 
         self.menu = tkinter.Menu(self.root)
         self.sub_menu = tkinter.Menu(self.menu, tearoff=0)
@@ -232,10 +393,10 @@ class Mp3Gui:
         self.hist = tkinter.Canvas(self.main_frame,
                                    width=Mp3Gui.HIST_SIZE,
                                    height=Mp3Gui.HIST_SIZE)
+        self.hist.bind("<Button-1>", self.on_hist_clicked)
         self.hist_image = None
 
-        self.frames_list = tkinter.Listbox(self.root, width=10)
-        self.frames_list.bind("<<ListboxSelect>>", self.on_frame_selected)
+        self.frames_list = FrameListView(self.root, self.on_frame_selected)
         self.frame_text = tkinter.Text(self.root, width=40, height=15)
 
         self.id3v1_frame = ID3v1TagFrame(self.root)
@@ -244,6 +405,9 @@ class Mp3Gui:
                                           width=Mp3Gui.ALBUM_COVER_SIZE,
                                           height=Mp3Gui.ALBUM_COVER_SIZE)
         self.album_cover_image = None
+        self.default_cover = None
+        self.thumbnails = thumbnails.ThumbnailCache(
+            Mp3Gui.ALBUM_COVER_SIZE, thumbnails.DEFAULT_DIRECTORY)
 
     def init(self):
         self.root.config(menu=self.menu)
@@ -263,6 +427,7 @@ class Mp3Gui:
         self.hist.grid(column=0, row=1, columnspan=2)
 
         self.frames_list.grid(column=1, row=0, rowspan=2)
+        self.frames_list.init()
         self.frame_text.grid(column=2, row=0, rowspan=2)
         self.frame_text.configure(state='disabled')
 
@@ -272,8 +437,6 @@ class Mp3Gui:
         self.id3v2_frame.init()
         self.album_cover.grid(row=2, column=2)
 
-        self.setup_watchdog()
-
     @handle_error
     def on_open_file(self):
         name = tkinter.filedialog.askopenfilename(
@@ -282,26 +445,66 @@ class Mp3Gui:
             self.process_file(name)
 
     def process_file(self, name):
+        if self.parse_job:
+            self.parse_job.cancel()
         self.clear_frames_list()
+        self.state.data = None
+        self.state.tags = (None, None)
+        self.id3v1_frame.set_text("Parsing...")
+        self.id3v2_frame.set_text("Parsing...")
+        self.set_default_album_cover()
+        self.set_audio(name)
 
-        with open(name, 'rb') as file:
-            data = decoder.decode(file)
-            self.state.data = data
-            self.fill_frames_list(len(self.state.data.frames))
+        self.state.hist = None
+        self.hist.delete('all')
+        self.load_waveform(name)
 
-        self.id3v1_frame.set_tag(self.state.data.meta_id3v1)
-        self.id3v2_frame.set_tag(self.state.data.meta_id3v2)
-        if self.state.data.meta_id3v2 \
-                and self.state.data.meta_id3v2.album_image_bytes:
-            self.set_album_cover(self.state.data.meta_id3v2.album_image_bytes)
-        else:
-            self.set_default_album_cover()
-        self.set_audio(name)
+        # frames and tags are filled in as the worker finds them
+        self.parse_job = worker.ParseJob(
+            name, lambda job: self.call_soon(self.on_parse_update, job),
+            self.index_cache).start()
 
-        segment = pydub.AudioSegment.from_mp3(name).set_channels(1)
-        self.state.hist = segment.get_array_of_samples()
-        self.fill_hist(segment.get_array_of_samples(),
-                       int(segment.max_possible_amplitude))
+    @handle_error
+    def on_parse_update(self, job: worker.ParseJob):
+        if job is not self.parse_job:
+            return
+        data = job.data
+        self.state.data = data
+        self.frames_list.set_frames(data.frames, job.frames_count)
+
+        # panels show "Parsing..." until their tag is found or parsing ends
+        id3v1, id3v2 = data.meta_id3v1, data.meta_id3v2
+        shown_id3v1, shown_id3v2 = self.state.tags
+        if id3v1 is not shown_id3v1 or job.done and not id3v1:
+            self.id3v1_frame.set_tag(id3v1)
+        if id3v2 is not shown_id3v2 or job.done and not id3v2:
+            self.id3v2_frame.set_tag(id3v2)
+            if id3v2 and id3v2.album_image_bytes:
+                self.set_album_cover(id3v2.album_image_bytes)
+        self.state.tags = (id3v1, id3v2)
+        if job.error:
+            raise job.error
+
+    def load_waveform(self, name):
+        """Summary is read from sidecar file or decoded on background
+        thread, Tk event loop draws it when ready"""
+        def summarize():
+            try:
+                peaks = waveform.load_peaks(name)
+            except Exception as e:
+                peaks = e
+            self.call_soon(self.on_waveform_loaded, name, peaks)
+
+        threading.Thread(target=summarize, daemon=True).start()
+
+    @handle_error
+    def on_waveform_loaded(self, name, peaks):
+        if name != self.state.filename:
+            return
+        if isinstance(peaks, Exception):
+            raise peaks
+        self.state.hist = peaks
+        self.fill_hist(peaks)
 
     def pause_audio(self):
         self.state.is_playing = False
@@ -312,6 +515,8 @@ class Mp3Gui:
         self.gui_queue.put((Mp3ThreadCommand.Play, None))
 
     def set_audio(self, name):
+        # player opens new file paused
+        self.state.is_playing = False
         self.state.filename = name
         self.gui_queue.put((Mp3ThreadCommand.Set, name))
 
@@ -319,16 +524,21 @@ class Mp3Gui:
         self.gui_queue.put((None, None))
         self.root.destroy()
 
-    def setup_watchdog(self):
-        def result_watchdog():
-            if player_queue.qsize():
-                command = player_queue.get_nowait()
-                if command == Mp3ThreadEvent.Finished:
-                    self.on_playback_finished()
+    def call_soon(self, func, *args):
+        """Runs func in Tk event loop, safe to call from other threads"""
+        try:
+            self.root.after_idle(func, *args)
+        except (RuntimeError, tkinter.TclError):
+            # window is already closed
+            pass
 
-            self.root.after(50, func=result_watchdog)
+    def post_player_event(self, event):
+        """Called from audio thread"""
+        self.call_soon(self.on_player_event, event)
 
-        self.root.after(50, func=result_watchdog)
+    def on_player_event(self, event):
+        if event == Mp3ThreadEvent.Finished:
+            self.on_playback_finished()
 
     @handle_error
     def on_play_button_pressed(self):
@@ -338,6 +548,14 @@ class Mp3Gui:
             else:
                 self.play_audio()
 
+    @handle_error
+    def on_hist_clicked(self, event):
+        if self.state.filename and self.state.data \
+                and len(self.state.data.frames):
+            seconds = self.state.data.duration * event.x / Mp3Gui.HIST_SIZE
+            _, offset = self.state.data.seek(seconds)
+            self.gui_queue.put((Mp3ThreadCommand.Seek, offset))
+
     def on_volume_changed(self, volume):
         self.gui_queue.put((Mp3ThreadCommand.Volume, int(volume) / 100))
 
@@ -347,66 +565,45 @@ class Mp3Gui:
     def run(self):
         self.root.mainloop()
 
-    def fill_hist(self, samples, sample_max_val):
-        data = ("{black}")
-        channel_height = Mp3Gui.HIST_SIZE
-        step = len(samples) // Mp3Gui.HIST_SIZE
-        self.hist_image = tkinter.PhotoImage(width=Mp3Gui.HIST_SIZE,
-                                             height=Mp3Gui.HIST_SIZE)
-        for x in range(0, Mp3Gui.HIST_SIZE):
-            sample = samples[min(x * step, len(samples))]
-            scaled_sample = int(channel_height // 2 * sample / sample_max_val)
-
-            if scaled_sample > 0:
-                y0 = channel_height // 2 - scaled_sample
-                y1 = channel_height // 2
-                self.hist_image.put(data, to=(x, y0, x + 1, y1))
-            elif scaled_sample < 0:
-                y0 = channel_height // 2
-                y1 = channel_height // 2 - scaled_sample
-                self.hist_image.put(data, to=(x, y0, x + 1, y1))
-
+    def fill_hist(self, peaks: waveform.Peaks):
+        pixels = waveform.render(peaks, Mp3Gui.HIST_SIZE, Mp3Gui.HIST_SIZE)
+        self.hist_image = ImageTk.PhotoImage(Image.fromarray(pixels, 'RGBA'))
+        self.hist.delete('all')
         self.hist.create_image((Mp3Gui.HIST_SIZE // 2, Mp3Gui.HIST_SIZE // 2),
                                image=self.hist_image)
 
     def set_default_album_cover(self):
-        bg = GRID.resize((Mp3Gui.ALBUM_COVER_SIZE, Mp3Gui.ALBUM_COVER_SIZE),
-                         Image.ANTIALIAS)
-        self.album_cover_image = ImageTk.PhotoImage(image=bg)
+        if self.default_cover is None:
+            self.default_cover = GRID.resize(
+                (Mp3Gui.ALBUM_COVER_SIZE, Mp3Gui.ALBUM_COVER_SIZE),
+                Image.ANTIALIAS)
+        self.album_cover_image = ImageTk.PhotoImage(image=self.default_cover)
         self.album_cover.create_image(
             (Mp3Gui.ALBUM_COVER_SIZE // 2, Mp3Gui.ALBUM_COVER_SIZE // 2),
             image=self.album_cover_image)
 
     def set_album_cover(self, data: bytes):
-        resized_image = Image.open(BytesIO(data)).resize(
-            (Mp3Gui.ALBUM_COVER_SIZE, Mp3Gui.ALBUM_COVER_SIZE),
-            Image.ANTIALIAS
-        )
-        self.album_cover_image = ImageTk.PhotoImage(resized_image, size=(
-            Mp3Gui.ALBUM_COVER_SIZE, Mp3Gui.ALBUM_COVER_SIZE
-        ))
+        # decoded once per distinct cover, see thumbnails.ThumbnailCache
+        self.album_cover_image = ImageTk.PhotoImage(self.thumbnails.get(data))
         self.album_cover.create_image(
             (Mp3Gui.ALBUM_COVER_SIZE // 2, Mp3Gui.ALBUM_COVER_SIZE // 2),
             image=self.album_cover_image
         )
 
     def clear_frames_list(self):
-        self.frames_list.delete(0, 'end')
+        self.frames_list.clear()
         self.frame_text.configure(state='normal')
         self.frame_text.delete(1.0, 'end')
         self.frame_text.configure(state='disabled')
 
-    def fill_frames_list(self, frames_count):
-        self.frames_list.insert('end', *range(frames_count))
-
-    def on_frame_selected(self, event):
-        selection = event.widget.curselection()
-        print("Frame selected:", selection)
-        if not selection:
-            return
-        frame_header = self.state.data.frames[selection[0]].header
+    def on_frame_selected(self, i):
+        print("Frame selected:", i)
+        frames = self.state.data.frames
+        frame_header = frames.header(i)
 
         header_description = (
+            f"Frame: {i} at {format_time(frames.times[i])}, "
+            f"offset {frames.offsets[i]}\n"
             f"Standart: {frame_header.standart.name}\n"
             f"Layer: {frame_header.layer}\n"
             f"Bitrate: {frame_header.bitrate}\n"
@@ -426,11 +623,10 @@ class Mp3Gui:
 
 if __name__ == '__main__':
     gui_queue = Queue()
-    player_queue = Queue()
+    gui = Mp3Gui(gui_queue)
 
-    bg_thread = Mp3Thread(gui_queue, player_queue)
+    bg_thread = Mp3Thread(gui_queue, gui.post_player_event)
     bg_thread.start()
 
-    gui = Mp3Gui(gui_queue, player_queue)
     gui.init()
     gui.run()
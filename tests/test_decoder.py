@@ -1,11 +1,63 @@
+import asyncio
+import errno
+import importlib.util
+import io
+import struct
 import sys
 import os
+import tempfile
+import types
 import unittest
+from unittest import mock
+
+import numpy
 
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
                              os.path.pardir))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.path.pardir, 'benchmarks'))
+
+import corpus
+from decoder import aio, batch, bitreader, cache, consts, crc, cut, \
+    decoder, huffman, playback, reader, reservoir, synthesis, thumbnails, \
+    waveform, worker
+
+
+class FakeStream:
+    """pyaudio stream that fails writes while stopped, like PortAudio"""
+
+    def __init__(self, start=True, **kwargs):
+        self.stopped = not start
+        self.written = 0
+
+    def start_stream(self):
+        self.stopped = False
+
+    def stop_stream(self):
+        self.stopped = True
+
+    def is_stopped(self):
+        return self.stopped
+
+    def close(self):
+        self.stopped = True
 
-from decoder import decoder, consts
+    def write(self, data):
+        if self.stopped:
+            raise OSError('Stream is stopped')
+        self.written += len(data)
+
+
+def load_gui():
+    """Imports mp3-gui.py with fake pyaudio module"""
+    pyaudio = types.ModuleType('pyaudio')
+    pyaudio.paInt16 = 8
+    pyaudio.PyAudio = lambda: types.SimpleNamespace(open=FakeStream)
+    spec = importlib.util.spec_from_file_location('mp3_gui', 'mp3-gui.py')
+    gui = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(sys.modules, {'pyaudio': pyaudio}):
+        spec.loader.exec_module(gui)
+    return gui
 
 
 class TestDecoder(unittest.TestCase):
@@ -16,6 +68,577 @@ class TestDecoder(unittest.TestCase):
         with open('tests/files/cool_music_v1.mp3', 'rb') as file:
             decoder.decode(file)
 
+    def test_decode_mmap(self):
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            mapped = decoder.decode(file)
+            self.assertEqual(file.tell(), 8400)
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            streamed = decoder.decode(io.BytesIO(file.read()))
+        self.assertEqual(len(mapped.frames), 55)
+        self.assertEqual(
+            [f.header.frame_length for f in mapped.frames],
+            [f.header.frame_length for f in streamed.frames],
+        )
+
+    def test_frame_index(self):
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            frames = decoder.decode(file).frames
+        self.assertEqual([f.offset for f in frames[:3]], [0, 192, 336])
+        self.assertEqual(frames[-1].offset, 8376)
+        self.assertIs(frames[1].header, frames.header(1))
+        self.assertEqual(sum(frames.lengths), 8400)
+        self.assertLess(len(frames.headers), len(frames))
+
+    def test_seek(self):
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            data = decoder.decode(file)
+        # Xing frame holds no audio, time starts at the next frame
+        self.assertEqual(data.frames.audio_start, 1)
+        self.assertEqual(data.frames.audio_count, 54)
+        self.assertAlmostEqual(data.duration, 54 * 0.024)
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            self.assertAlmostEqual(data.duration,
+                                   decoder.probe(file).duration)
+        self.assertEqual(data.seek(0)[1], data.frames.offsets[1])
+        self.assertEqual(data.frames.frame_at(-1), 1)
+        found, offset = data.seek(0.5)
+        # 0.5 s is in audio frame 20, frame 21 of the file
+        self.assertEqual(data.frames.frame_at(0.5), 21)
+        self.assertEqual(offset, data.frames.offsets[21])
+        self.assertEqual(found.offset, offset)
+        self.assertEqual(data.frames.frame_at(100), 54)
+
+    def test_iter_frames(self):
+        with open('tests/files/click_with_id.mp3', 'rb') as file:
+            items = list(decoder.iter_frames(file, headers_only=True))
+            file.seek(0)
+            self.assertEqual(decoder.count_frames(file), 6)
+        self.assertIsInstance(items[0], decoder.meta.MetaID3V2)
+        self.assertEqual(len(items), 7)
+        with open('tests/files/pop_sound.mp3', 'rb') as file:
+            stream = io.BytesIO(file.read())
+        first = next(decoder.iter_frames(stream))
+        self.assertEqual(first.offset, 0)
+        self.assertEqual(stream.tell(), first.header.frame_length)
+
+    def test_probe(self):
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            info = decoder.probe(file)
+            self.assertLess(file.tell(), 1000)
+            scanned = decoder.probe(io.BytesIO(b'ID3\x03\x00\x00\x00\x00'
+                                               b'\x00\x00' + b'\xff\xf3'
+                                               b'\x84\x64' + b'\x00' * 140))
+        self.assertFalse(info.scanned)
+        self.assertEqual(info.vbr_header.tag, b'Xing')
+        self.assertEqual(info.frames_count, 54)
+        self.assertAlmostEqual(info.duration, 1.296)
+        self.assertEqual(len(info.vbr_header.toc), 100)
+        self.assertTrue(scanned.scanned)
+        self.assertEqual(scanned.frames_count, 1)
+        self.assertEqual(scanned.audio_offset, 10)
+        self.assertTrue(info.has_audio)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'junk.mp3')
+            with open(path, 'wb') as file:
+                file.write(b'\x00' * 5000)
+            with open(path, 'rb') as file:
+                empty = decoder.probe(file)
+                # mapped file is left where the scan stopped
+                self.assertEqual(file.tell(), 5000)
+            self.assertFalse(empty.has_audio)
+            for full in (False, True):
+                record = batch.scan_file(path, full)
+                self.assertEqual(record.frames, 0)
+                self.assertEqual(record.error, batch.NO_AUDIO_ERROR)
+
+    def test_sideinfo(self):
+        header = decoder.frame.header_from_bytes(b'\xff\xfb\x90\x44')
+        data = bytes(range(7, 7 + 32 * 3, 3))
+        si = decoder.frame.sideinfo.decode_sideinfo(header, data)
+        self.assertEqual(si.main_data_start, 14)
+        self.assertEqual(si.part_23_length, [[3344, 297], [3727, 3748]])
+        self.assertEqual(si.big_values, [[38, 130], [160, 341]])
+        self.assertEqual(si.block_type, [[0, 0], [0, 2]])
+        self.assertEqual(si.region0_count[1][1], 7)
+
+        header = decoder.frame.header_from_bytes(b'\xff\xf3\x84\xc4')
+        si = decoder.frame.sideinfo.decode_sideinfo(header, b'\xff' * 9)
+        self.assertEqual(si.granules, 1)
+        self.assertEqual(si.main_data_start, 255)
+        self.assertEqual(si.scalefac_compress[0][0], 511)
+
+    def test_cut(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # Xing frame is left out, 54 audio frames are split
+            outputs = cut.split('tests/files/door_bell.mp3', [10, 30],
+                                os.path.join(directory, '{index}{suffix}'),
+                                frames=True)
+            self.assertEqual([os.path.basename(path) for path in outputs],
+                             ['1.mp3', '2.mp3', '3.mp3'])
+            counts = []
+            for path in outputs:
+                with open(path, 'rb') as file:
+                    data = decoder.decode(file)
+                self.assertFalse(data.skipped)
+                counts.append(len(data.frames))
+            self.assertEqual(counts, [9, 20, 25])
+
+            # 0.5 s of audio is in frame 21, after Xing frame and 20 audio
+            # frames of 24 ms
+            with cut.Source('tests/files/door_bell.mp3') as source:
+                self.assertEqual(source.first_frame, 1)
+                self.assertEqual(source.frame_at(0.5), 21)
+                self.assertEqual(source.frame_at(0), 1)
+            output = os.path.join(directory, 'bell.mp3')
+            self.assertEqual(cut.cut('tests/files/door_bell.mp3', output,
+                                     0.5, 1.0), (21, 42))
+
+            output = os.path.join(directory, 'click.mp3')
+            self.assertEqual(cut.cut('tests/files/click_with_id.mp3',
+                                     output, 2, 4, frames=True), (2, 4))
+            with open(output, 'rb') as file:
+                data = decoder.decode(file)
+            self.assertEqual(len(data.frames), 2)
+            self.assertIsNotNone(data.meta_id3v2)
+            cut.cut('tests/files/click_with_id.mp3', output, 2, 4,
+                    frames=True, tags=False)
+            with open(output, 'rb') as file:
+                self.assertIsNone(decoder.decode(file).meta_id3v2)
+
+            # fallback copy gives the same bytes as kernel copy
+            src = os.open('tests/files/door_bell.mp3', os.O_RDONLY)
+            try:
+                for method in cut.COPY_METHODS + (cut.read_write,):
+                    with tempfile.TemporaryFile() as file:
+                        self.assertEqual(method(src, file.fileno(), 100, 50),
+                                         50)
+                        file.seek(0)
+                        self.assertEqual(file.read(), os.pread(src, 50, 100))
+
+                # method failing for one pair of files is dropped for that
+                # pair only
+                def unsupported(*args):
+                    raise OSError(errno.EXDEV, 'cross-device copy')
+
+                methods = [unsupported]
+                with mock.patch.object(cut, 'COPY_METHODS', (unsupported,)), \
+                        tempfile.TemporaryFile() as file:
+                    cut.copy_range(src, file.fileno(), 100, 50, methods)
+                    file.seek(0)
+                    self.assertEqual(file.read(), os.pread(src, 50, 100))
+                    self.assertEqual(methods, [])
+                    self.assertEqual(cut.COPY_METHODS, (unsupported,))
+            finally:
+                os.close(src)
+
+        # descriptor is closed when tag can't be read
+        with mock.patch.object(cut.Source, 'id3v2_range',
+                               side_effect=struct.error), \
+                mock.patch.object(cut.os, 'close',
+                                  wraps=os.close) as close:
+            with self.assertRaises(struct.error):
+                cut.Source('tests/files/click_with_id.mp3')
+            close.assert_called_once()
+
+    def test_crc(self):
+        # CRC-16/CMS check value
+        self.assertEqual(crc.crc16(b'123456789'), 0xaee7)
+
+        # protected MPEG 1 Layer III 128 kbps frames, fourth one damaged
+        header = b'\xff\xfa\x90\x44'
+        side = bytes(range(7, 7 + 32 * 3, 3))
+        word = crc.crc16(side, crc.crc16(header[2:]))
+        good = header + struct.pack('>H', word) + side + b'\x00' * 379
+        bad = header + struct.pack('>H', word ^ 1) + side + b'\x00' * 379
+        data = good * 3 + bad + good * 2
+        self.assertEqual(len(good), 417)
+
+        verified = decoder.decode(io.BytesIO(data),
+                                  crc_mode=crc.CrcMode.Verify)
+        self.assertEqual(len(verified.frames), 6)
+        self.assertEqual(verified.integrity.as_dict(), {
+            'protected': 6, 'passed': 5, 'unchecked': 0, 'failed': [1251]})
+        # side info is read after CRC word
+        first = next(decoder.iter_frames(io.BytesIO(data),
+                                         decode_audio=True))
+        self.assertEqual(first.sideinfo.main_data_start, 14)
+
+        dropped = decoder.decode(io.BytesIO(data),
+                                 crc_mode=crc.CrcMode.Drop)
+        self.assertEqual(len(dropped.frames), 5)
+        self.assertEqual([(s.offset, s.reason) for s in dropped.skipped],
+                         [(1251, 'CRC mismatch')])
+        self.assertIsNone(decoder.decode(io.BytesIO(data)).integrity)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'protected.mp3')
+            with open(path, 'wb') as file:
+                file.write(data)
+            for use_mmap in (True, False):
+                with open(path, 'rb') as file:
+                    report = decoder.verify_crc(file, use_mmap)
+                self.assertEqual((report.protected, report.failed),
+                                 (6, [1251]))
+            record = batch.scan_file(path, verify=True)
+            self.assertEqual((record.crc_protected, record.crc_failed),
+                             (6, 1))
+
+    def test_layer3(self):
+        reader = bitreader.BitReader(b'\x60\x00')
+        table = huffman.BIG_VALUE_TABLES[2]
+        self.assertEqual([table.read(reader), table.read(reader)],
+                         [(1, 0), (2, 2)])
+
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            data = file.read()
+        frames = decoder.decode(io.BytesIO(data)).frames
+        frame_decoder = decoder.frame.FrameDecoder()
+        bits = reservoir.Reservoir()
+        peak = 0.0
+        for frame in frames[1:]:
+            header = frame.header
+            body = data[frame.offset + 4:frame.offset + header.frame_length]
+            si = frame_decoder.decode_sideinfo(header, body)
+            main_data = bits.push(si.main_data_start, body[si.size:])
+            for granule in frame_decoder.decode_data(header, si, main_data):
+                self.assertEqual(granule[0].xr.shape, (576,))
+                peak = max(peak, abs(granule[0].xr).max())
+        self.assertGreater(peak, 0.01)
+        self.assertLess(peak, 1.5)
+
+    def test_reservoir(self):
+        bits = reservoir.Reservoir(size=1024)
+        self.assertIsNone(bits.push(10, b'a' * 300))
+        self.assertEqual(bytes(bits.push(0, b'b' * 300)), b'b' * 300)
+        # wraps: last 511 bytes move to buffer start
+        main_data = bits.push(400, b'c' * 500)
+        self.assertEqual(bytes(main_data), b'a' * 100 + b'b' * 300
+                         + b'c' * 500)
+        self.assertEqual(bits.end, 1011)
+        self.assertIsNone(bits.push(1000, b'd'))
+        self.assertEqual(bytes(bits.push(2, b'e')), b'cde')
+        bits.clear()
+        self.assertIsNone(bits.push(1, b'f'))
+        self.assertEqual(bytes(bits.push(1, b'g')), b'fg')
+
+    def test_synthesis(self):
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            chunks = list(synthesis.iter_pcm(file, batch=16))
+        # 54 MPEG 2 frames of 576 samples after Xing frame
+        self.assertEqual([len(chunk) for chunk in chunks],
+                         [16 * 576] * 3 + [6 * 576])
+        self.assertEqual(chunks[0].shape[1], 2)
+        pcm = numpy.concatenate(chunks)
+        self.assertEqual(pcm.dtype, numpy.int16)
+        self.assertGreater(abs(pcm).max(), 10000)
+
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            floats = numpy.concatenate(
+                list(synthesis.iter_pcm(file, numpy.float32, batch=5)))
+        self.assertEqual(floats.dtype, numpy.float32)
+        self.assertLessEqual(abs(floats * 32768 - pcm).max(), 0.5)
+
+    def test_playback(self):
+        ahead = playback.DecodeAhead('tests/files/door_bell.mp3',
+                                     chunk_frames=4, ahead=2)
+        self.assertEqual((ahead.samplerate, ahead.channels), (24000, 2))
+        chunks = []
+        while True:
+            pcm = ahead.get(timeout=10)
+            if pcm is None:
+                break
+            chunks.append(pcm)
+        self.assertIsNone(ahead.error)
+        self.assertEqual(sum(len(pcm) for pcm in chunks), 54 * 576)
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            expected = numpy.concatenate(list(synthesis.iter_pcm(file)))
+        self.assertTrue((numpy.concatenate(chunks) == expected).all())
+
+        half = playback.scale(chunks[0].copy(), 0.5)
+        self.assertLessEqual(abs(half - chunks[0] / 2).max(), 1)
+        self.assertEqual(playback.fit_channels(chunks[0][:, :1], 2).shape,
+                         chunks[0].shape)
+
+        # producer blocked on full queue stops on close
+        ahead = playback.DecodeAhead('tests/files/door_bell.mp3',
+                                     chunk_frames=1, ahead=1)
+        ahead.close()
+        ahead.thread.join(10)
+        self.assertFalse(ahead.thread.is_alive())
+        self.assertTrue(ahead.file.closed)
+
+    @unittest.skipIf(thumbnails.Image is None, 'Pillow is not installed')
+    def test_player_state(self):
+        try:
+            gui = load_gui()
+        except ImportError as e:
+            self.skipTest(str(e))
+        events = []
+        player = gui.PlayerState(events.append)
+        player.set('tests/files/door_bell.mp3')
+        self.assertTrue(player.stream.is_stopped())
+        player.play()
+        player.update()
+        self.assertGreater(player.stream.written, 0)
+
+        # seek during playback restarts the new stream
+        player.seek(1000)
+        self.assertTrue(player.is_playing)
+        self.assertFalse(player.stream.is_stopped())
+        player.update()
+        player.pause()
+        player.seek(1000)
+        self.assertFalse(player.is_playing)
+        self.assertTrue(player.stream.is_stopped())
+
+        # new file is opened paused
+        player.play()
+        player.set('tests/files/door_bell.mp3')
+        self.assertFalse(player.is_playing)
+
+        player.play()
+        while player.is_playing:
+            player.update()
+        self.assertEqual(events, [gui.Mp3ThreadEvent.Finished])
+        self.assertTrue(player.stream.is_stopped())
+        player.close()
+
+    def test_worker(self):
+        updates = []
+        job = worker.ParseJob(
+            'tests/files/door_bell.mp3',
+            lambda job: updates.append((job.frames_count, job.done)),
+            batch=10).start()
+        job.thread.join(10)
+        self.assertEqual(updates, [(10, False), (20, False), (30, False),
+                                   (40, False), (50, False), (55, True)])
+        self.assertIsNone(job.error)
+
+        updates = []
+        job = worker.ParseJob('tests/files/click_with_id.mp3',
+                              lambda job: updates.append(job.frames_count))
+        job.parse()
+        # ID3v2 tag is published before any frame
+        self.assertEqual(updates, [0])
+        self.assertEqual(job.frames_count, 6)
+
+        job = worker.ParseJob('tests/files/door_bell.mp3', updates.append)
+        job.cancel()
+        job.run()
+        self.assertEqual(job.frames_count, 0)
+        self.assertEqual(len(updates), 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            index_cache = cache.FrameIndexCache(directory)
+            job = worker.ParseJob('tests/files/door_bell.mp3',
+                                  lambda job: None, index_cache)
+            job.run()
+            cached = index_cache.get('tests/files/door_bell.mp3')
+            self.assertEqual(len(cached.frames), 55)
+            job = worker.ParseJob('tests/files/door_bell.mp3',
+                                  lambda job: None, index_cache)
+            job.run()
+            self.assertEqual(job.frames_count, 55)
+
+            # tag reaches the UI thread already detached from the mapping,
+            # which is closed while the UI may decode its frames
+            path = os.path.join(directory, 'tagged.mp3')
+            with open(path, 'wb') as file:
+                file.write(corpus.make_id3v2(4096)
+                           + corpus.make_stream(frames_count=4))
+            published = []
+
+            def on_update(job):
+                if job.data.meta_id3v2 and not published:
+                    published.extend(
+                        data for _, _, data, _
+                        in job.data.meta_id3v2._pending.values())
+
+            worker.ParseJob(path, on_update).run()
+            self.assertTrue(published)
+            self.assertFalse(any(isinstance(data, memoryview)
+                                 for data in published))
+
+    @unittest.skipIf(thumbnails.Image is None, 'Pillow is not installed')
+    def test_thumbnails(self):
+        cover = io.BytesIO()
+        thumbnails.Image.new('RGB', (1600, 1200), (200, 10, 10)) \
+            .save(cover, 'JPEG')
+        cover = cover.getvalue()
+        with tempfile.TemporaryDirectory() as directory:
+            covers = thumbnails.ThumbnailCache(100, directory, max_items=1)
+            image = covers.get(cover)
+            self.assertEqual((image.size, image.mode), ((100, 100), 'RGB'))
+            self.assertIs(covers.get(cover), image)
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+            other = io.BytesIO()
+            thumbnails.Image.new('L', (50, 50)).save(other, 'PNG')
+            covers.get(other.getvalue())
+            self.assertEqual(len(covers.images), 1)
+            # evicted from memory, loaded back from disk
+            reloaded = covers.get(cover)
+            self.assertIsNot(reloaded, image)
+            self.assertEqual(reloaded.getpixel((50, 50)),
+                             image.getpixel((50, 50)))
+
+    def test_waveform(self):
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            peaks = waveform.summarize(file)
+        self.assertEqual(peaks.samples, 54 * 576)
+        self.assertEqual([len(level[0]) for level in peaks.levels],
+                         [31, 8, 2, 1, 1, 1])
+        self.assertGreater(peaks.levels[-1][1][0], 0.3)
+        self.assertEqual(peaks.level_for(8), 1)
+        self.assertEqual(peaks.columns(100)[0].shape, (100,))
+
+        # streaming by chunks gives the same buckets
+        builder = waveform.PeakBuilder(peaks.samplerate)
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            for pcm in synthesis.iter_pcm(file, numpy.float32, batch=3):
+                builder.add(pcm)
+        self.assertTrue(numpy.allclose(builder.finish().levels[0][1],
+                                       peaks.levels[0][1]))
+
+        stat = os.stat('tests/files/door_bell.mp3')
+        file = io.BytesIO()
+        waveform.dump(peaks, file, stat)
+        file.seek(0)
+        loaded = waveform.load(file, stat)
+        self.assertEqual(loaded.samples, peaks.samples)
+        self.assertLessEqual(abs(loaded.levels[0][0] - peaks.levels[0][0])
+                             .max(), 1 / waveform.SCALE)
+        file.seek(0)
+        stale = os.stat_result((0,) * 6 + (stat.st_size + 1,) + (0,) * 3)
+        self.assertIsNone(waveform.load(file, stale))
+
+        image = waveform.render(peaks, 40, 30)
+        self.assertEqual(image.shape, (30, 40, 4))
+        self.assertTrue(image[15, :, 3].all())
+        self.assertFalse(image[0, :, 3].all())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'door_bell.mp3')
+            with open('tests/files/door_bell.mp3', 'rb') as source, \
+                    open(path, 'wb') as target:
+                target.write(source.read())
+            first = waveform.load_peaks(path)
+            self.assertTrue(os.path.exists(path + waveform.SUFFIX))
+            second = waveform.load_peaks(path)
+            self.assertEqual(second.samples, first.samples)
+
+    def test_batch(self):
+        records = list(batch.scan_library(
+            batch.iter_paths(['tests/files', 'tests/files/missing.mp3']),
+            jobs=1))
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[2].path, 'tests/files/door_bell.mp3')
+        self.assertEqual(records[2].frames, 54)
+        self.assertIsNone(records[2].error)
+        self.assertIn('FileNotFoundError', records[4].error)
+        # full decode and probe agree, Xing frame isn't counted
+        for record in records[:4]:
+            full = batch.scan_file(record.path, full=True)
+            self.assertEqual(full.frames, record.frames)
+            self.assertAlmostEqual(full.duration, record.duration)
+            self.assertAlmostEqual(full.bitrate, record.bitrate)
+        self.assertEqual(batch.scan_file('tests/files/door_bell.mp3',
+                                         full=True).frames, 54)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index_cache = cache.FrameIndexCache(directory, max_size=1500)
+            path = 'tests/files/click_with_id.mp3'
+            self.assertIsNone(index_cache.get(path))
+            decoded = index_cache.decode(path)
+            cached = index_cache.get(path)
+            self.assertEqual(list(cached.frames.offsets),
+                             list(decoded.frames.offsets))
+            self.assertEqual(cached.duration, decoded.duration)
+            self.assertEqual(cached.meta_id3v2.version, 0x0200)
+            index_cache.decode('tests/files/door_bell.mp3')
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertEqual(index_cache.get('tests/files/door_bell.mp3')
+                             .frames.audio_start, 1)
+            self.assertIsNone(index_cache.get(path))
+
+    def test_aio(self):
+        with open('tests/files/door_bell.mp3', 'rb') as file:
+            data = file.read()
+
+        async def scan():
+            stream = asyncio.StreamReader()
+            stream.feed_data(data)
+            stream.feed_eof()
+            return await aio.scan_many(
+                [stream, 'tests/files/door_bell.mp3', 'tests/files/missing'],
+                full=True, concurrency=2)
+
+        from_stream, from_path, missing = asyncio.run(scan())
+        self.assertEqual(len(from_stream.frames), 55)
+        self.assertEqual(list(from_stream.frames.offsets),
+                         list(from_path.frames.offsets))
+        self.assertIsInstance(missing, FileNotFoundError)
+        info = asyncio.run(aio.probe('tests/files/door_bell.mp3'))
+        self.assertEqual(info.frames_count, 54)
+
+        class Upload:
+            """Source served in 100 byte chunks"""
+
+            def __init__(self):
+                self.reads = 0
+
+            async def read(self, size):
+                start = self.reads * 100
+                self.reads += 1
+                await asyncio.sleep(0)
+                return data[start:start + min(size, 100)]
+
+        upload = Upload()
+        decoded = asyncio.run(aio.decode(upload))
+        self.assertEqual(list(decoded.frames.offsets),
+                         list(from_path.frames.offsets))
+        self.assertEqual(upload.reads, len(data) // 100 + 1)
+        # probe reads Xing frame only, feeding stops with parser
+        upload = Upload()
+        self.assertEqual(asyncio.run(aio.probe(upload)).frames_count, 54)
+        self.assertLess(upload.reads, len(data) // 200)
+
+    def test_synthetic_corpus(self):
+        for name, data in corpus.default_corpus(scale=0.02):
+            decoded = decoder.decode(io.BytesIO(data))
+            info = decoder.probe(io.BytesIO(data))
+            self.assertEqual(len(decoded.frames), info.frames_count + 1)
+            audio_end = len(data) - (128 if decoded.meta_id3v1 else 0)
+            self.assertEqual(
+                decoded.frames.offsets[-1] + decoded.frames.lengths[-1],
+                audio_end, name)
+            if name.startswith('tagged'):
+                self.assertEqual(decoded.meta_id3v2.title, 'Synthetic title')
+                self.assertEqual(decoded.meta_id3v1.title, 'Synthetic')
+
+    def test_resync(self):
+        stream = corpus.make_stream(corpus.MPEG_1, corpus.STEREO, 20)
+        junk = b'\x00\xff\xfb\x90' * 100 + b'\xff' * 10
+        data = b'junk' + stream + junk + stream[:-50] + stream \
+            + corpus.make_id3v1()
+        with tempfile.TemporaryFile() as file:
+            file.write(data)
+            file.seek(0)
+            mapped = decoder.decode(file)
+        streamed = decoder.decode(io.BytesIO(data))
+        for decoded in (mapped, streamed):
+            self.assertEqual(decoded.skipped[0].offset, 0)
+            self.assertEqual(decoded.skipped[0].length, 4)
+            self.assertEqual(decoded.skipped[1].offset, 4 + len(stream))
+            self.assertEqual(decoded.skipped[1].length, len(junk))
+            self.assertEqual(decoded.meta_id3v1.title, 'Synthetic')
+        self.assertEqual(len(mapped.frames), 21 * 3 - 1)
+        self.assertEqual(mapped.skipped[2].reason, 'truncated frame')
+        with self.assertRaises(BaseException):
+            decoder.decode(io.BytesIO(data), resync=False)
+
     def test_meta(self):
         meta = decoder.meta.MetaID3V2(0x0300, 0xF)
 
@@ -44,6 +667,106 @@ class TestDecoder(unittest.TestCase):
         self.assertEqual(meta.encoder, "teststring")
         self.assertEqual(meta.copyright, "teststring")
 
+    def test_meta_lazy(self):
+        tag = corpus.make_id3v2(4096)
+        data = tag + corpus.make_stream(frames_count=4)
+
+        decoded = decoder.decode(io.BytesIO(data))
+        meta = decoded.meta_id3v2
+        self.assertIn('album_image_bytes', meta._pending)
+        self.assertTrue(meta.has_album_image())
+        self.assertEqual(meta.title, 'Synthetic title')
+        self.assertEqual(len(meta.album_image_bytes), 4096)
+        self.assertNotIn('album_image_bytes', meta._pending)
+
+        with tempfile.TemporaryFile() as file:
+            file.write(data)
+            file.seek(0)
+            decoded = decoder.decode(file, tag_frames={'TIT2', 'TPE1'})
+        meta = decoded.meta_id3v2
+        self.assertFalse(meta.has_album_image())
+        self.assertEqual(meta.performer_1, 'Benchmark')
+        self.assertIsNone(meta.album)
+        self.assertEqual(len(decoded.frames), 5)
+
+        # mapping is closed once parsing ends. Short pending frames are
+        # copied out of it, the cover is read from the file on access
+        mapped = []
+        map_file = reader.map_file
+
+        def spy(file):
+            mapped.append(map_file(file))
+            return mapped[-1]
+
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(reader, 'map_file', spy):
+            path = os.path.join(directory, 'tagged.mp3')
+            with open(path, 'wb') as file:
+                file.write(data)
+            with open(path, 'rb') as file:
+                decoded = decoder.decode(file)
+                file.seek(0)
+                wanted = decoder.decode(file, tag_frames={'APIC'})
+                file.seek(0)
+                info = decoder.probe(file)
+                file.seek(0)
+                decoder.verify_crc(file)
+            self.assertEqual(len(mapped), 4)
+            self.assertTrue(all(stream.mapped.closed for stream in mapped))
+            pending = decoded.meta_id3v2._pending
+            self.assertIsInstance(pending['album_image_bytes'][2],
+                                  decoder.meta.FileRange)
+            self.assertIsInstance(pending['title'][2], bytes)
+            self.assertEqual(decoded.meta_id3v2.album_image_bytes,
+                             wanted.meta_id3v2.album_image_bytes)
+            self.assertEqual(len(decoded.meta_id3v2.album_image_bytes), 4096)
+            self.assertEqual(info.meta_id3v2.title, 'Synthetic title')
+
+    def test_meta_v24(self):
+        title = b'\x00\xff\x00\xe0 title'
+        lyrics = b'\x01eng\xff\xfed\x00\x00\x00' \
+            + ('la' * 5000).encode('utf-16')
+        size = struct.Struct('>I')
+        frames = b'TIT2' + size.pack(corpus.synchsafe(len(title) + 4)) \
+            + b'\x00\x03' + size.pack(corpus.synchsafe(len(title) - 1)) \
+            + title
+        frames += b'USLT' + size.pack(corpus.synchsafe(len(lyrics))) \
+            + b'\x00\x00' + lyrics
+        extended = size.pack(6) + b'\x01\x00'
+        body = extended + frames
+        tag = b'ID3' + struct.pack('>HBI', 0x0400, 0x40,
+                                   corpus.synchsafe(len(body))) + body
+
+        for stream in (io.BytesIO(tag[4:]),
+                       decoder.reader.MemoryReader(tag, 4)):
+            meta = decoder.meta.parse_id3v2(tag[:4], stream)
+            self.assertEqual(meta.title, 'ÿà title')
+            self.assertEqual(meta.lyrics, 'la' * 5000)
+        meta = decoder.meta.parse_id3v2(
+            tag[:4], decoder.reader.MemoryReader(tag, 4), wanted={'USLT'})
+        self.assertIsNone(meta.title)
+        self.assertEqual(len(meta.lyrics), 10000)
+
+    def test_header_cache(self):
+        header = decoder.frame.header_from_bytes(b'\xff\xfb\x90\xc4')
+        self.assertIs(header,
+                      decoder.frame.header_from_bytes(b'\xff\xfb\x90\xc4'))
+        self.assertEqual(header.bitrate, 128)
+        self.assertEqual(header.frame_length, 417)
+        with self.assertRaises(AttributeError):
+            header.bitrate = 320
+
+        # sync candidates aren't cached, full cache makes room for new
+        # patterns
+        candidate = b'\xff\xfb\x94\xc4'
+        decoder.frame.header_from_bytes(candidate, cache=False)
+        self.assertIsNone(decoder.frame.cached_header(candidate))
+        with mock.patch.object(decoder.frame, 'HEADER_CACHE_LIMIT', 1):
+            decoder.frame.header_from_bytes(candidate)
+            self.assertIsNone(decoder.frame.cached_header(
+                b'\xff\xfb\x90\xc4'))
+            self.assertIsNotNone(decoder.frame.cached_header(candidate))
+
     def test_calc_bitrate(self):
         self.assertEqual(decoder.frame.calc_bitrate(
             consts.Standards.MPEG_1, decoder.frame.LAYER_1, 0b1110),